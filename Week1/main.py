@@ -4,39 +4,46 @@ import json
 PRICE_URL = 'https://lite-api.jup.ag/price/v2'
 TOKEN_URL = 'https://lite-api.jup.ag/tokens/v1'
 HEADERS = {"Accept": "application/json"}
+# Upper bound for each upstream call, so a hung request cannot block its caller forever.
+UPSTREAM_TIMEOUT_SECONDS = 10
 
 
 def get_tagged_tokens():
     url = f"{TOKEN_URL}/tagged/verified"
-    response = requests.get(url, headers=HEADERS)
+    response = requests.get(url, headers=HEADERS, timeout=UPSTREAM_TIMEOUT_SECONDS)
     response.raise_for_status()
     return response.json()
 
 
-def get_token_prices(token_symbol: str):
-    tagged = get_tagged_tokens()
-
-    mint = None
+def find_mint(token_symbol: str, tagged: list[dict]) -> str:
     for token in tagged:
         if token.get("symbol") == token_symbol:
-            mint = token.get("address")
-            break
+            return token.get("address")
+    raise ValueError(f"Token symbol '{token_symbol}' not found in tagged tokens.")
 
-    if mint is None:
-        raise ValueError(f"Token symbol '{token_symbol}' not found in tagged tokens.")
 
-    url = f"{PRICE_URL}?ids={mint}"
-    response = requests.get(url, headers=HEADERS)
+def get_prices(mints: list[str]) -> dict[str, float]:
+    """Fetches the prices of several mints with a single request. Mints without price data are omitted."""
+    url = f"{PRICE_URL}?ids={','.join(mints)}"
+    response = requests.get(url, headers=HEADERS, timeout=UPSTREAM_TIMEOUT_SECONDS)
     response.raise_for_status()
 
-    response_json = response.json()
-    data = response_json.get("data", {})
+    data = response.json().get("data", {}) or {}
+    return {
+        mint: float(entry["price"])
+        for mint, entry in data.items()
+        if entry and entry.get("price") is not None
+    }
 
-    if mint not in data:
-        raise ValueError(f"Price data not found for mint: {mint}")
 
-    return float(data[mint].get("price"))
+def get_token_prices(token_symbol: str):
+    mint = find_mint(token_symbol, get_tagged_tokens())
+
+    prices = get_prices([mint])
+    if mint not in prices:
+        raise ValueError(f"Price data not found for mint: {mint}")
 
+    return prices[mint]
 
 
 if __name__ == "__main__":
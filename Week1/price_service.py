@@ -0,0 +1,173 @@
+import json
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from main import UPSTREAM_TIMEOUT_SECONDS, find_mint, get_prices, get_tagged_tokens
+
+HOST = "127.0.0.1"
+PORT = 8787
+PRICE_TTL_SECONDS = 10
+TOKEN_LIST_TTL_SECONDS = 3600
+# How long the batcher waits for other consumers before calling upstream.
+BATCH_WINDOW_SECONDS = 0.05
+MAX_IDS_PER_REQUEST = 100
+# A miss may queue behind the batch already in flight, so allow for two upstream calls.
+PRICE_WAIT_SECONDS = 2 * UPSTREAM_TIMEOUT_SECONDS + BATCH_WINDOW_SECONDS
+
+
+class PriceCache:
+    """
+    In-memory price cache shared by every local consumer.
+
+    Fresh prices are served from memory. Concurrent misses for the same mint wait on one
+    shared future (single-flight), and all misses collected during BATCH_WINDOW_SECONDS are
+    fetched with one upstream request, so upstream volume depends on the number of distinct
+    mints and the TTL, not on the number of consumers.
+    """
+
+    def __init__(self, ttl: float = PRICE_TTL_SECONDS):
+        self.ttl = ttl
+        self._prices: dict[str, tuple[float | None, float]] = {}  # mint -> (price, fetched_at)
+        self._inflight: dict[str, Future] = {}
+        self._pending: list[str] = []
+        self._lock = threading.Lock()
+        self._has_pending = threading.Condition(self._lock)
+
+        self._tagged: list[dict] | None = None
+        self._tagged_at = 0.0
+        self._tagged_lock = threading.Lock()
+
+        self.upstream_requests = 0
+        threading.Thread(target=self._batch_loop, daemon=True).start()
+
+    def resolve_symbol(self, symbol: str) -> str:
+        # Only one thread refreshes the token list; the others wait for it and reuse it.
+        with self._tagged_lock:
+            if self._tagged is None or time.monotonic() - self._tagged_at > TOKEN_LIST_TTL_SECONDS:
+                self._tagged = get_tagged_tokens()
+                self._tagged_at = time.monotonic()
+                self.upstream_requests += 1
+            tagged = self._tagged
+        return find_mint(symbol, tagged)
+
+    def get_prices(self, mints: list[str]) -> dict[str, float | None]:
+        now = time.monotonic()
+        results: dict[str, float | None] = {}
+        waiting: dict[str, Future] = {}
+
+        with self._lock:
+            for mint in mints:
+                cached = self._prices.get(mint)
+                if cached is not None and now - cached[1] <= self.ttl:
+                    results[mint] = cached[0]
+                elif mint in self._inflight:
+                    waiting[mint] = self._inflight[mint]
+                else:
+                    future = Future()
+                    self._inflight[mint] = future
+                    self._pending.append(mint)
+                    waiting[mint] = future
+            if self._pending:
+                self._has_pending.notify()
+
+        for mint, future in waiting.items():
+            results[mint] = future.result(timeout=PRICE_WAIT_SECONDS)
+        return results
+
+    def _batch_loop(self):
+        while True:
+            with self._lock:
+                while not self._pending:
+                    self._has_pending.wait()
+            time.sleep(BATCH_WINDOW_SECONDS)
+            with self._lock:
+                batch, self._pending = self._pending, []
+
+            for i in range(0, len(batch), MAX_IDS_PER_REQUEST):
+                chunk = batch[i:i + MAX_IDS_PER_REQUEST]
+                try:
+                    prices = get_prices(chunk)
+                    error = None
+                except Exception as e:
+                    prices, error = {}, e
+                self.upstream_requests += 1
+
+                fetched_at = time.monotonic()
+                with self._lock:
+                    futures = [(mint, self._inflight.pop(mint)) for mint in chunk]
+                    if error is None:
+                        for mint in chunk:
+                            self._prices[mint] = (prices.get(mint), fetched_at)
+                for mint, future in futures:
+                    if error is None:
+                        future.set_result(prices.get(mint))
+                    else:
+                        future.set_exception(error)
+
+
+class PriceRequestHandler(BaseHTTPRequestHandler):
+    cache: PriceCache = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != "/price":
+            self._send_json(404, {"error": "Not found. Use /price?symbols=SOL,JUP"})
+            return
+
+        symbols = [s.strip() for s in ",".join(parse_qs(url.query).get("symbols", [])).split(",") if s.strip()]
+        if not symbols:
+            self._send_json(400, {"error": "Missing 'symbols' query parameter."})
+            return
+
+        prices, errors, mint_of = {}, {}, {}
+        for symbol in symbols:
+            try:
+                mint_of[symbol] = self.cache.resolve_symbol(symbol)
+            except Exception as e:
+                errors[symbol] = str(e)
+
+        try:
+            mint_prices = self.cache.get_prices(list(set(mint_of.values())))
+        except Exception as e:
+            self._send_json(502, {"error": f"Upstream price request failed: {e}"})
+            return
+
+        for symbol, mint in mint_of.items():
+            if mint_prices.get(mint) is None:
+                errors[symbol] = f"Price data not found for mint: {mint}"
+            else:
+                prices[symbol] = mint_prices[mint]
+
+        self._send_json(200, {"prices": prices, "errors": errors})
+
+    def _send_json(self, status: int, body: dict):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host: str = HOST, port: int = PORT):
+    PriceRequestHandler.cache = PriceCache()
+    server = ThreadingHTTPServer((host, port), PriceRequestHandler)
+    print(f"Price service listening on http://{host}:{port}/price?symbols=SOL")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Stopped. Upstream requests made: {PriceRequestHandler.cache.upstream_requests}")
+
+
+if __name__ == "__main__":
+    serve(port=int(sys.argv[1]) if len(sys.argv) > 1 else PORT)
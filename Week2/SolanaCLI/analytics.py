@@ -0,0 +1,245 @@
+import asyncio
+from datetime import datetime, timezone
+
+import numpy as np
+from solana.rpc.async_api import AsyncClient
+from solders.pubkey import Pubkey
+from solders.system_program import ID as SYSTEM_PROGRAM_ID
+from spl.token.constants import TOKEN_PROGRAM_ID
+
+from solana_actions import LAMPORTS_PER_SOL
+
+SOL_LABEL = "SOL"
+SECONDS_PER_DAY = 86_400
+# getSignaturesForAddress trả về tối đa 1000 signature mỗi trang.
+SIGNATURE_PAGE_LIMIT = 1000
+# Số lệnh get_transaction chạy đồng thời khi nạp lịch sử.
+MAX_CONCURRENT_FETCHES = 10
+
+
+class TransferTable:
+    """
+    Các lệnh chuyển đã giải mã, lưu theo cột. Mint và đối tác được mã hóa thành số nguyên
+    ngay khi nạp để mọi phép group-by về sau chỉ là np.bincount trên mảng số nguyên.
+    """
+
+    def __init__(self):
+        self._signatures: list[str] = []
+        self._block_times: list[int] = []
+        self._mint_codes: list[int] = []
+        self._directions: list[int] = []
+        self._amounts: list[float] = []
+        self._counterparty_codes: list[int] = []
+        self.mints: list[str] = []
+        self.counterparties: list[str] = []
+        self._mint_index: dict[str, int] = {}
+        self._counterparty_index: dict[str, int] = {}
+        self._frozen = None
+
+    def append(self, signature: str, block_time: int | None, mint: str, direction: int, amount: float, counterparty: str):
+        """direction: +1 là nhận vào, -1 là gửi đi."""
+        mint_code = self._mint_index.setdefault(mint, len(self.mints))
+        if mint_code == len(self.mints):
+            self.mints.append(mint)
+        cp_code = self._counterparty_index.setdefault(counterparty, len(self.counterparties))
+        if cp_code == len(self.counterparties):
+            self.counterparties.append(counterparty)
+
+        self._signatures.append(signature)
+        self._block_times.append(block_time or 0)
+        self._mint_codes.append(mint_code)
+        self._directions.append(direction)
+        self._amounts.append(amount)
+        self._counterparty_codes.append(cp_code)
+        self._frozen = None
+
+    def __len__(self) -> int:
+        return len(self._amounts)
+
+    def columns(self) -> dict[str, np.ndarray]:
+        if self._frozen is None:
+            self._frozen = {
+                "signature": np.array(self._signatures, dtype=object),
+                "block_time": np.array(self._block_times, dtype=np.int64),
+                "mint": np.array(self._mint_codes, dtype=np.int64),
+                "direction": np.array(self._directions, dtype=np.int8),
+                "amount": np.array(self._amounts, dtype=np.float64),
+                "counterparty": np.array(self._counterparty_codes, dtype=np.int64),
+            }
+        return self._frozen
+
+
+# ==============================================================================
+# --- 1. Các phép tổng hợp vector hóa ---
+# ==============================================================================
+def net_flows_by_mint(table: TransferTable) -> dict[str, tuple[float, float, float]]:
+    """{mint: (tổng nhận, tổng gửi, ròng)}."""
+    cols = table.columns()
+    n_mints = len(table.mints)
+    incoming = cols["direction"] > 0
+    inflow = np.bincount(cols["mint"], weights=np.where(incoming, cols["amount"], 0.0), minlength=n_mints)
+    outflow = np.bincount(cols["mint"], weights=np.where(incoming, 0.0, cols["amount"]), minlength=n_mints)
+    return {table.mints[i]: (inflow[i], outflow[i], inflow[i] - outflow[i]) for i in range(n_mints)}
+
+
+def counterparty_totals(table: TransferTable, top: int = 10) -> list[tuple[str, str, float, float]]:
+    """Các cặp (mint, đối tác) có tổng khối lượng lớn nhất: [(mint, đối tác, tổng nhận, tổng gửi)]."""
+    cols = table.columns()
+    if not len(table):
+        return []
+    n_cp = len(table.counterparties)
+    keys = cols["mint"] * n_cp + cols["counterparty"]
+    uniq, inverse = np.unique(keys, return_inverse=True)
+    incoming = cols["direction"] > 0
+    inflow = np.bincount(inverse, weights=np.where(incoming, cols["amount"], 0.0), minlength=len(uniq))
+    outflow = np.bincount(inverse, weights=np.where(incoming, 0.0, cols["amount"]), minlength=len(uniq))
+    order = np.argsort(-(inflow + outflow))[:top]
+    return [
+        (table.mints[uniq[i] // n_cp], table.counterparties[uniq[i] % n_cp], inflow[i], outflow[i])
+        for i in order
+    ]
+
+
+def daily_volumes(table: TransferTable) -> list[tuple[str, str, float, int]]:
+    """Khối lượng theo ngày (UTC) và mint: [(ngày, mint, tổng khối lượng, số lệnh)], sắp theo ngày."""
+    cols = table.columns()
+    if not len(table):
+        return []
+    n_mints = len(table.mints)
+    days = cols["block_time"] // SECONDS_PER_DAY
+    keys = days * n_mints + cols["mint"]
+    uniq, inverse = np.unique(keys, return_inverse=True)
+    volume = np.bincount(inverse, weights=cols["amount"], minlength=len(uniq))
+    counts = np.bincount(inverse, minlength=len(uniq))
+    return [
+        (
+            datetime.fromtimestamp(int(key // n_mints) * SECONDS_PER_DAY, timezone.utc).strftime('%Y-%m-%d'),
+            table.mints[int(key % n_mints)],
+            volume[i],
+            int(counts[i]),
+        )
+        for i, key in enumerate(uniq)
+    ]
+
+
+# ==============================================================================
+# --- 2. Nạp và giải mã lịch sử ---
+# ==============================================================================
+def _iter_instructions(transaction_detail):
+    meta = transaction_detail.meta
+    message = transaction_detail.transaction.message
+    yield from getattr(message, 'instructions', None) or []
+    for inner_instruction_set in getattr(meta, 'inner_instructions', None) or []:
+        yield from inner_instruction_set.instructions
+
+
+def extract_transfers(
+    table: TransferTable, signature: str, transaction_detail, block_time: int | None,
+    owned_accounts_strs: set[str], ata_mints: dict[str, tuple[str, int]]
+):
+    """
+    Thêm các lệnh chuyển SOL / SPL token liên quan tới tài khoản của bạn vào `table`.
+    `ata_mints` ánh xạ tài khoản token của bạn tới (mint, số thập phân) để giải mã lệnh `transfer` không có mint.
+    Chuyển nội bộ giữa hai tài khoản của bạn bị bỏ qua vì không làm thay đổi dòng tiền.
+    """
+    meta = transaction_detail.meta
+    if meta is not None and meta.err:
+        return
+
+    for instruction in _iter_instructions(transaction_detail):
+        parsed = getattr(instruction, 'parsed', None)
+        if not isinstance(parsed, dict):
+            continue
+        info = parsed.get('info', {})
+        instruction_type = parsed.get('type')
+        source, dest = info.get('source'), info.get('destination')
+        is_sending, is_receiving = source in owned_accounts_strs, dest in owned_accounts_strs
+        if is_sending == is_receiving:
+            continue
+        direction, counterparty = (-1, dest) if is_sending else (1, source)
+        owned_side = source if is_sending else dest
+
+        if instruction.program_id == SYSTEM_PROGRAM_ID and instruction_type == 'transfer':
+            table.append(signature, block_time, SOL_LABEL, direction, info.get('lamports', 0) / LAMPORTS_PER_SOL, counterparty)
+
+        elif instruction.program_id == TOKEN_PROGRAM_ID and instruction_type == 'transferChecked':
+            token_amount = info.get('tokenAmount', {})
+            amount = float(token_amount.get('uiAmountString') or 0)
+            table.append(signature, block_time, info.get('mint'), direction, amount, counterparty)
+
+        elif instruction.program_id == TOKEN_PROGRAM_ID and instruction_type == 'transfer':
+            if owned_side not in ata_mints:
+                continue
+            mint, decimals = ata_mints[owned_side]
+            table.append(signature, block_time, mint, direction, int(info.get('amount', 0)) / 10**decimals, counterparty)
+
+
+async def _collect_signatures(client: AsyncClient, addresses: list[Pubkey], max_per_address: int) -> list:
+    """Phân trang getSignaturesForAddress cho từng địa chỉ và gộp các signature trùng nhau."""
+    seen = {}
+    for address in addresses:
+        before, fetched = None, 0
+        while fetched < max_per_address:
+            limit = min(SIGNATURE_PAGE_LIMIT, max_per_address - fetched)
+            resp = await client.get_signatures_for_address(address, before=before, limit=limit)
+            page = resp.value or []
+            for sig_info in page:
+                seen.setdefault(sig_info.signature, sig_info)
+            fetched += len(page)
+            if len(page) < limit:
+                break
+            before = page[-1].signature
+    return list(seen)
+
+
+async def load_transfer_table(
+    client: AsyncClient, owned_accounts: list[Pubkey], ata_mints: dict[str, tuple[str, int]], max_per_address: int
+) -> TransferTable:
+    """Nạp lịch sử của mọi tài khoản sở hữu và giải mã các lệnh chuyển vào một TransferTable."""
+    owned_accounts_strs = {str(pk) for pk in owned_accounts}
+    signatures = await _collect_signatures(client, owned_accounts, max_per_address)
+    print(f"Tìm thấy {len(signatures)} giao dịch. Đang lấy chi tiết...")
+
+    table = TransferTable()
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_FETCHES)
+    failed = 0
+
+    async def fetch_and_extract(signature):
+        # Giải mã ngay khi mỗi giao dịch về để không phải giữ toàn bộ phản hồi JSON trong bộ nhớ.
+        nonlocal failed
+        async with semaphore:
+            try:
+                tx_response = await client.get_transaction(signature, encoding="jsonParsed", max_supported_transaction_version=0)
+            except Exception:
+                tx_response = None
+        if not (tx_response and tx_response.value):
+            failed += 1
+            return
+        tx_data = tx_response.value
+        extract_transfers(table, str(signature), tx_data.transaction, tx_data.block_time, owned_accounts_strs, ata_mints)
+
+    await asyncio.gather(*(fetch_and_extract(sig) for sig in signatures))
+    if failed:
+        print(f"Cảnh báo: Không thể lấy {failed} giao dịch.")
+    return table
+
+
+# ==============================================================================
+# --- 3. Báo cáo ---
+# ==============================================================================
+def print_flow_report(table: TransferTable, top_counterparties: int = 10):
+    if not len(table):
+        print("Không có lệnh chuyển nào liên quan tới tài khoản của bạn.")
+        return
+
+    print(f"\n--- Dòng tiền theo mint ({len(table)} lệnh chuyển) ---")
+    for mint, (inflow, outflow, net) in net_flows_by_mint(table).items():
+        print(f"  {mint}: nhận {inflow:.9g} | gửi {outflow:.9g} | ròng {net:+.9g}")
+
+    print(f"\n--- {top_counterparties} đối tác có khối lượng lớn nhất ---")
+    for mint, counterparty, inflow, outflow in counterparty_totals(table, top_counterparties):
+        print(f"  {counterparty} ({mint}): nhận {inflow:.9g} | gửi {outflow:.9g}")
+
+    print("\n--- Khối lượng theo ngày (UTC) ---")
+    for day, mint, volume, count in daily_volumes(table):
+        print(f"  {day} {mint}: {volume:.9g} ({count} lệnh)")
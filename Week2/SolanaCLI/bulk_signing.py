@@ -0,0 +1,253 @@
+import asyncio
+import csv
+import math
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from solana.rpc.async_api import AsyncClient
+from solana.rpc.types import TxOpts
+from solders.hash import Hash
+from solders.instruction import Instruction
+from solders.keypair import Keypair
+from solders.message import MessageV0
+from solders.pubkey import Pubkey
+from solders.system_program import AdvanceNonceAccountParams, TransferParams, advance_nonce_account
+from solders.system_program import transfer as sol_transfer
+from solders.transaction import VersionedTransaction
+
+from solana_actions import LAMPORTS_PER_SOL
+from utils import login_with_secret_key
+
+MAX_PARALLEL_SENDS = 8
+# Số giao dịch ký chung một blockhash; mỗi đợt được gửi xong trước khi blockhash (~60-90 giây) hết hạn.
+BLOCKHASH_WAVE_SIZE = 512
+# Bố cục tài khoản nonce: version (u32), state (u32), authority (32 byte), nonce (32 byte), fee_calculator (u64).
+NONCE_AUTHORITY_OFFSET = 8
+NONCE_VALUE_OFFSET = 40
+
+
+# ==============================================================================
+# --- 1. Durable nonce ---
+# ==============================================================================
+async def fetch_nonce(client: AsyncClient, nonce_account: Pubkey) -> tuple[Pubkey, Hash]:
+    """Đọc (authority, giá trị nonce hiện tại) của một tài khoản nonce."""
+    resp = await client.get_account_info(nonce_account)
+    if resp.value is None:
+        raise ValueError(f"Không tìm thấy tài khoản nonce {nonce_account}")
+    data = bytes(resp.value.data)
+    authority = Pubkey(data[NONCE_AUTHORITY_OFFSET:NONCE_AUTHORITY_OFFSET + 32])
+    nonce_value = Hash(data[NONCE_VALUE_OFFSET:NONCE_VALUE_OFFSET + 32])
+    return authority, nonce_value
+
+
+# ==============================================================================
+# --- 2. Ký trong tiến trình con ---
+# ==============================================================================
+def _sign_chunk(payer_secret: bytes, jobs: list[tuple[list[bytes], bytes, bytes | None]]) -> list[bytes]:
+    """
+    Chạy trong tiến trình con: biên dịch và ký từng message.
+    Mỗi job là (các chỉ thị dạng bytes, blockhash hoặc giá trị nonce dạng bytes, tài khoản nonce dạng bytes hoặc None).
+    Đầu vào và kết quả đều là bytes thuần, không phụ thuộc vào việc phiên bản solders có pickle được đối tượng hay không.
+    """
+    payer = Keypair.from_bytes(payer_secret)
+    signed = []
+    for raw_instructions, raw_blockhash, raw_nonce_account in jobs:
+        instructions = [Instruction.from_bytes(raw) for raw in raw_instructions]
+        if raw_nonce_account is not None:
+            nonce_account = Pubkey(raw_nonce_account)
+            # Giao dịch dùng durable nonce phải bắt đầu bằng chỉ thị advance_nonce_account.
+            instructions = [
+                advance_nonce_account(AdvanceNonceAccountParams(nonce_pubkey=nonce_account, authorized_pubkey=payer.pubkey())),
+                *instructions,
+            ]
+        msg = MessageV0.try_compile(
+            payer=payer.pubkey(),
+            instructions=instructions,
+            address_lookup_table_accounts=[],
+            recent_blockhash=Hash(raw_blockhash),
+        )
+        signed.append(bytes(VersionedTransaction(msg, [payer])))
+    return signed
+
+
+class BulkSigner:
+    """
+    Biên dịch và ký hàng loạt message trong một ProcessPoolExecutor, để việc ký ed25519
+    không tranh CPU với vòng lặp sự kiện đang gửi giao dịch hoặc giám sát.
+    """
+
+    def __init__(self, max_workers: int | None = None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        # "spawn" thay vì fork: fork khi vòng lặp sự kiện đang có các thread làm việc (to_thread, đọc stdin) là không an toàn.
+        self._executor = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+    async def sign(
+        self,
+        payer: Keypair,
+        messages: list[list[Instruction]],
+        recent_blockhash: Hash | None = None,
+        nonces: list[tuple[Pubkey, Hash]] | None = None,
+    ) -> list[VersionedTransaction]:
+        """
+        Ký `messages` bằng `payer`. Dùng `recent_blockhash`, hoặc `nonces` là danh sách
+        (tài khoản nonce, giá trị nonce) với đúng một tài khoản nonce cho mỗi message,
+        vì mỗi lần advance chỉ làm hợp lệ một giao dịch. Payer phải là authority của các nonce.
+        Giao dịch ký bằng nonce không hết hạn theo blockhash nên có thể gửi sau.
+        """
+        raw_messages = [[bytes(ix) for ix in ixs] for ixs in messages]
+        if nonces is not None:
+            if len(nonces) != len(messages):
+                raise ValueError("Cần đúng một tài khoản nonce cho mỗi message.")
+            jobs = [
+                (raw_ixs, bytes(nonce_value), bytes(nonce_account))
+                for raw_ixs, (nonce_account, nonce_value) in zip(raw_messages, nonces)
+            ]
+        elif recent_blockhash is not None:
+            jobs = [(raw_ixs, bytes(recent_blockhash), None) for raw_ixs in raw_messages]
+        else:
+            raise ValueError("Cần recent_blockhash hoặc nonces.")
+
+        loop = asyncio.get_running_loop()
+        payer_secret = bytes(payer)
+        # Một phần cho mỗi tiến trình con, để mọi lõi CPU cùng ký dù đợt giao dịch lớn hay nhỏ.
+        chunk_size = max(1, math.ceil(len(jobs) / self.max_workers))
+        chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+        results = await asyncio.gather(
+            *(loop.run_in_executor(self._executor, _sign_chunk, payer_secret, chunk) for chunk in chunks)
+        )
+        return [VersionedTransaction.from_bytes(raw) for chunk_result in results for raw in chunk_result]
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+# ==============================================================================
+# --- 3. Gửi giao dịch đã ký ---
+# ==============================================================================
+async def send_signed_transactions(
+    client: AsyncClient, transactions: list[VersionedTransaction], max_parallel: int = MAX_PARALLEL_SENDS
+) -> list:
+    """Gửi đồng thời các giao dịch đã ký. Trả về signature hoặc Exception cho từng giao dịch, theo thứ tự."""
+    semaphore = asyncio.Semaphore(max_parallel)
+
+    async def send(tx: VersionedTransaction):
+        async with semaphore:
+            resp = await client.send_transaction(tx, opts=TxOpts(skip_preflight=False))
+            return resp.value
+
+    return await asyncio.gather(*(send(tx) for tx in transactions), return_exceptions=True)
+
+
+def load_nonce_accounts(path: str) -> list[Pubkey]:
+    """Đọc tệp danh sách tài khoản nonce: mỗi dòng một public key, bỏ qua dòng trống và dòng bắt đầu bằng '#'."""
+    accounts = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                accounts.append(Pubkey.from_string(line))
+            except ValueError:
+                print(f"[Cảnh báo] Dòng {line_no}: địa chỉ tài khoản nonce không hợp lệ, bỏ qua: {line}")
+    return accounts
+
+
+async def _sign_and_send_in_waves(
+    client: AsyncClient, signer: BulkSigner, payer: Keypair, messages: list[list[Instruction]]
+) -> list:
+    """Ký và gửi theo từng đợt BLOCKHASH_WAVE_SIZE giao dịch, mỗi đợt dùng một blockhash mới."""
+    results = []
+    for start in range(0, len(messages), BLOCKHASH_WAVE_SIZE):
+        wave = messages[start:start + BLOCKHASH_WAVE_SIZE]
+        blockhash = (await client.get_latest_blockhash()).value.blockhash
+        print(f"Đang ký và gửi giao dịch {start + 1}-{start + len(wave)}/{len(messages)}...")
+        transactions = await signer.sign(payer, wave, recent_blockhash=blockhash)
+        results.extend(await send_signed_transactions(client, transactions))
+    return results
+
+
+async def _sign_and_send_with_nonces(
+    client: AsyncClient, signer: BulkSigner, payer: Keypair, messages: list[list[Instruction]], nonce_accounts: list[Pubkey]
+) -> list | None:
+    """Ký mọi giao dịch trước bằng durable nonce (không hết hạn), rồi gửi. Trả về None nếu danh sách nonce không dùng được."""
+    if len(nonce_accounts) < len(messages):
+        print(f"[Lỗi] Cần {len(messages)} tài khoản nonce, nhưng chỉ có {len(nonce_accounts)}.")
+        return None
+    nonce_accounts = nonce_accounts[:len(messages)]
+    try:
+        nonce_states = await asyncio.gather(*(fetch_nonce(client, a) for a in nonce_accounts))
+    except ValueError as e:
+        print(f"[Lỗi] {e}")
+        return None
+    nonces = []
+    for nonce_account, (authority, nonce_value) in zip(nonce_accounts, nonce_states):
+        if authority != payer.pubkey():
+            print(f"[Lỗi] Authority của tài khoản nonce {nonce_account} là {authority}, không phải ví của bạn.")
+            return None
+        nonces.append((nonce_account, nonce_value))
+
+    print(f"Đang ký {len(messages)} giao dịch bằng durable nonce trong process pool...")
+    transactions = await signer.sign(payer, messages, nonces=nonces)
+    print("Đang gửi...")
+    return await send_signed_transactions(client, transactions)
+
+
+def load_payouts(path: str) -> list[tuple[Pubkey, int]]:
+    """Đọc tệp CSV với mỗi dòng `địa chỉ người nhận,số SOL`. Trả về [(người nhận, lamports)]."""
+    payouts = []
+    with open(path, newline="", encoding="utf-8") as f:
+        for line_no, row in enumerate(csv.reader(f), start=1):
+            if not row or row[0].strip().startswith("#"):
+                continue
+            try:
+                payouts.append((Pubkey.from_string(row[0].strip()), int(float(row[1]) * LAMPORTS_PER_SOL)))
+            except (ValueError, IndexError):
+                print(f"[Cảnh báo] Dòng {line_no} không hợp lệ, bỏ qua: {row}")
+    return payouts
+
+
+async def run_payouts(payouts_path: str, nonce_accounts_path: str | None = None):
+    sender = login_with_secret_key()
+    if not sender:
+        return
+    payouts = load_payouts(payouts_path)
+    if not payouts:
+        print("Không có khoản chi trả nào để gửi.")
+        return
+
+    client = AsyncClient("https://api.devnet.solana.com")
+    signer = BulkSigner()
+    try:
+        messages = [
+            [sol_transfer(TransferParams(from_pubkey=sender.pubkey(), to_pubkey=receiver, lamports=lamports))]
+            for receiver, lamports in payouts
+        ]
+        if nonce_accounts_path:
+            results = await _sign_and_send_with_nonces(
+                client, signer, sender, messages, load_nonce_accounts(nonce_accounts_path)
+            )
+            if results is None:
+                return
+        else:
+            results = await _sign_and_send_in_waves(client, signer, sender, messages)
+        failures = [r for r in results if isinstance(r, Exception)]
+        for (receiver, _), result in zip(payouts, results):
+            if isinstance(result, Exception):
+                print(f"  [Lỗi] {receiver}: {result}")
+        print(f"Đã gửi {len(results) - len(failures)}/{len(results)} giao dịch.")
+    finally:
+        signer.close()
+        await client.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Cách dùng: py bulk_signing.py <payouts.csv> [nonce_accounts.txt]")
+        sys.exit(1)
+    try:
+        asyncio.run(run_payouts(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None))
+    except KeyboardInterrupt:
+        print("\nĐã đóng chương trình.")
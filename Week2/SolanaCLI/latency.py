@@ -0,0 +1,118 @@
+import asyncio
+import time
+from collections import deque
+
+# Số mẫu gần nhất được giữ lại cho mỗi giai đoạn.
+MAX_SAMPLES_PER_STAGE = 1000
+# Chu kỳ in dòng thống kê độ trễ khi đang giám sát.
+LATENCY_LOG_INTERVAL_SECONDS = 60
+
+# (tên giai đoạn, mốc bắt đầu, mốc kết thúc). block_time chỉ có độ chính xác tới giây.
+# Mốc bắt đầu None nghĩa là giá trị ở mốc kết thúc đã là một khoảng thời gian cộng dồn qua các lần thử.
+STAGES = (
+    ("khối→thông báo", "block_time", "notified_at"),
+    ("thông báo→gửi RPC", "notified_at", "fetch_started"),
+    ("get_transaction (mọi lần thử)", None, "fetch_time"),
+    ("chờ thử lại", None, "retry_wait"),
+    ("phân tích→in", "fetch_returned", "emitted"),
+    ("tổng (thông báo→in)", "notified_at", "emitted"),
+)
+
+
+def _percentile(sorted_values: list[float], pct: float) -> float:
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class LatencyTracer:
+    """
+    Theo dõi từng signature qua các giai đoạn của trình giám sát trực tiếp
+    và tổng hợp độ trễ của mỗi giai đoạn thành các phân vị p50/p90/p99.
+    Các mốc thời gian là thời gian thực (time.time()) để so sánh được với block_time.
+    """
+
+    def __init__(self):
+        self._open: dict = {}
+        self._samples: dict[str, deque] = {name: deque(maxlen=MAX_SAMPLES_PER_STAGE) for name, _, _ in STAGES}
+        self._slot_lag: deque = deque(maxlen=MAX_SAMPLES_PER_STAGE)
+        self.completed = 0
+
+    def start(self, signature, notified_at: float, notified_slot: int | None = None):
+        self._open[signature] = {"notified_at": notified_at, "notified_slot": notified_slot}
+
+    def mark(self, signature, stage: str, value: float | None = None):
+        trace = self._open.get(signature)
+        if trace is not None:
+            trace[stage] = time.time() if value is None else value
+
+    def begin_fetch(self, signature):
+        """
+        Đánh dấu bắt đầu một lần gọi get_transaction. Lần đầu đặt mốc 'fetch_started';
+        các lần thử lại cộng khoảng chờ kể từ lần gọi trước vào 'retry_wait'.
+        """
+        trace = self._open.get(signature)
+        if trace is None:
+            return
+        now = time.time()
+        if "fetch_returned" in trace:
+            trace["retry_wait"] = trace.get("retry_wait", 0.0) + now - trace["fetch_returned"]
+        else:
+            trace["fetch_started"] = now
+        trace["attempt_started"] = now
+
+    def end_fetch(self, signature):
+        """Đánh dấu một lần gọi get_transaction đã trả về (thành công hay không) và cộng thời gian của nó vào 'fetch_time'."""
+        trace = self._open.get(signature)
+        if trace is None:
+            return
+        now = time.time()
+        trace["fetch_time"] = trace.get("fetch_time", 0.0) + now - trace.pop("attempt_started", now)
+        trace["fetch_returned"] = now
+
+    def discard(self, signature):
+        self._open.pop(signature, None)
+
+    def finish(self, signature, tx_slot: int | None = None):
+        trace = self._open.pop(signature, None)
+        if trace is None:
+            return
+        trace["emitted"] = time.time()
+        for name, begin, end in STAGES:
+            if trace.get(end) is None:
+                continue
+            if begin is None:
+                self._samples[name].append(trace[end])
+            elif trace.get(begin) is not None:
+                self._samples[name].append(trace[end] - trace[begin])
+        if tx_slot is not None and trace.get("notified_slot") is not None:
+            self._slot_lag.append(trace["notified_slot"] - tx_slot)
+        self.completed += 1
+
+    def summary_lines(self) -> list[str]:
+        lines = []
+        for name, _, _ in STAGES:
+            values = sorted(self._samples[name])
+            if not values:
+                continue
+            lines.append(
+                f"{name}: p50={_percentile(values, 50) * 1000:.0f}ms "
+                f"p90={_percentile(values, 90) * 1000:.0f}ms "
+                f"p99={_percentile(values, 99) * 1000:.0f}ms (n={len(values)})"
+            )
+        if self._slot_lag:
+            values = sorted(self._slot_lag)
+            lines.append(f"độ lệch slot (thông báo - giao dịch): p50={_percentile(values, 50)} max={values[-1]}")
+        return lines
+
+    def report(self) -> str:
+        lines = self.summary_lines()
+        if not lines:
+            return "Chưa có giao dịch nào được theo dõi độ trễ."
+        return "\n".join([f"--- Độ trễ theo giai đoạn ({self.completed} giao dịch) ---", *lines])
+
+    async def log_periodically(self, interval: float = LATENCY_LOG_INTERVAL_SECONDS):
+        while True:
+            await asyncio.sleep(interval)
+            lines = self.summary_lines()
+            if lines:
+                print(f"\n[Độ trễ] {' | '.join(lines)}")
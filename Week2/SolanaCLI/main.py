@@ -1,9 +1,9 @@
 import asyncio
 from solana.rpc.async_api import AsyncClient
-from solders.pubkey import Pubkey
 
-from utils import login_with_secret_key, print_header
-from solana_actions import transfer_assets, get_transaction_history, live_monitor
+from utils import ainput, login_with_secret_key, print_header
+from wallet_cache import WalletCache
+from solana_actions import transfer_assets, get_transaction_history, live_monitor, scan_block_range
 
 async def main_menu():
     """Hàm chính điều khiển menu và luồng ứng dụng."""
@@ -20,22 +20,30 @@ async def main_menu():
         await client.close()
         return
 
+    # Nạp nền danh sách tài khoản, lịch sử gần nhất, số thập phân mint và blockhash
+    # trong lúc người dùng đọc menu, để chức năng 1 và 2 phản hồi ngay.
+    cache = WalletCache(client, user_keypair.pubkey())
+    cache.start_prefetch()
+
     while True:
         print_header("Menu chính")
         print("1. Chuyển SOL / SPL Token")
         print("2. Xem lịch sử giao dịch")
         print("3. Giám sát giao dịch trực tiếp")
-        print("4. Thoát")
-        choice = input("Vui lòng chọn một chức năng: ").strip()
+        print("4. Quét khối theo khoảng slot")
+        print("5. Phân tích dòng tiền")
+        print("6. Thoát")
+        choice = (await ainput("Vui lòng chọn một chức năng: ")).strip()
 
         if choice == '1':
             print_header("Chức năng 1: Chuyển tiền")
-            receiver_str = input("Nhập địa chỉ ví người nhận (public key): ").strip()
-            mint_str = input("Nhập địa chỉ mint token (hoặc 'SOL' cho native SOL): ").strip()
-            amount_str = input("Nhập số lượng để gửi (ví dụ: 1.5): ").strip()
+            receiver_str = (await ainput("Nhập địa chỉ ví người nhận (public key): ")).strip()
+            mint_str = (await ainput("Nhập địa chỉ mint token (hoặc 'SOL' cho native SOL): ")).strip()
+            amount_str = (await ainput("Nhập số lượng để gửi (ví dụ: 1.5): ")).strip()
+            fast = (await ainput("Gửi nhanh (kiểm tra cục bộ, bỏ qua mô phỏng)? (y/N): ")).strip().lower() == 'y'
             try:
                 amount = float(amount_str)
-                await transfer_assets(client, user_keypair, receiver_str, mint_str, amount)
+                await transfer_assets(client, user_keypair, receiver_str, mint_str, amount, cache=cache, fast=fast)
             except ValueError:
                 print("[Lỗi] Số lượng không hợp lệ.")
             except Exception as e:
@@ -44,47 +52,26 @@ async def main_menu():
         elif choice == '2':
             print_header("Chức năng 2: Lịch sử giao dịch")
             try:
-                # --- Lấy danh sách tài khoản để người dùng lựa chọn ---
+                # --- Lấy danh sách tài khoản để người dùng lựa chọn (đã được nạp nền sau khi đăng nhập) ---
                 print("Đang tìm các tài khoản của bạn để lựa chọn...")
-                from spl.token.constants import TOKEN_PROGRAM_ID
-                from solana.rpc.types import TokenAccountOpts
-                from spl.token._layouts import ACCOUNT_LAYOUT # Thêm import để parse dữ liệu
-
                 main_wallet_pubkey = user_keypair.pubkey()
                 
                 # Dùng list of tuples để lưu (tên hiển thị, pubkey)
                 selectable_accounts = [ (f"Ví chính (SOL): {main_wallet_pubkey}", main_wallet_pubkey) ]
                 
-                # Lấy dữ liệu thô để tránh lỗi parse JSON của thư viện
-                token_accounts_resp = await client.get_token_accounts_by_owner(
-                    main_wallet_pubkey, TokenAccountOpts(program_id=TOKEN_PROGRAM_ID)
-                )
-                
-                if token_accounts_resp.value:
-                    for acc_info in token_accounts_resp.value:
-                        pubkey_to_check = acc_info.pubkey
-                        try:
-                            # Parse dữ liệu thô để lấy mint address
-                            account_data = ACCOUNT_LAYOUT.parse(acc_info.account.data)
-                            # Chuyển đổi bytes thành địa chỉ Pubkey dạng chuỗi Base58
-                            mint_address = str(Pubkey(account_data.mint))
-                            
-                            # Lấy số dư riêng biệt để tăng độ ổn định
-                            balance_resp = await client.get_token_account_balance(pubkey_to_check)
-                            balance = balance_resp.value.ui_amount_string
-                            
-                            display_name = f"Token: {mint_address} (Số dư: {balance})"
-                            selectable_accounts.append( (display_name, pubkey_to_check) )
-                        except Exception:
-                            # Nếu có lỗi (ví dụ tài khoản đã đóng), hiện thông tin cơ bản
-                            display_name = f"Tài khoản Token: {pubkey_to_check}"
-                            selectable_accounts.append( (display_name, pubkey_to_check) )
+                for pubkey_to_check, mint_address, balance in await cache.get_token_accounts():
+                    if mint_address is not None and balance is not None:
+                        display_name = f"Token: {mint_address} (Số dư: {balance})"
+                    else:
+                        # Nếu có lỗi (ví dụ tài khoản đã đóng), hiện thông tin cơ bản
+                        display_name = f"Tài khoản Token: {pubkey_to_check}"
+                    selectable_accounts.append( (display_name, pubkey_to_check) )
 
                 print("\nChọn tài khoản để xem lịch sử:")
                 for i, (display_name, _) in enumerate(selectable_accounts):
                     print(f"  {i+1}. {display_name}")
 
-                acc_choice_str = input(f"Nhập lựa chọn (1-{len(selectable_accounts)}): ").strip()
+                acc_choice_str = (await ainput(f"Nhập lựa chọn (1-{len(selectable_accounts)}): ")).strip()
                 acc_choice = int(acc_choice_str) - 1
 
                 if not 0 <= acc_choice < len(selectable_accounts):
@@ -95,12 +82,12 @@ async def main_menu():
                 selected_pubkey_to_query = selectable_accounts[acc_choice][1]
                 # --- Kết thúc phần lựa chọn tài khoản ---
 
-                limit_str = input("Nhập số lượng giao dịch gần nhất muốn xem (ví dụ: 5): ").strip()
+                limit_str = (await ainput("Nhập số lượng giao dịch gần nhất muốn xem (ví dụ: 5): ")).strip()
                 limit = int(limit_str)
                 if limit <= 0:
                     print("[Lỗi] Vui lòng nhập một số dương.")
                 else:
-                    await get_transaction_history(client, selected_pubkey_to_query, limit)
+                    await get_transaction_history(client, selected_pubkey_to_query, limit, cache=cache)
             except ValueError:
                 print("[Lỗi] Lựa chọn hoặc số lượng không hợp lệ. Vui lòng nhập số.")
             except Exception as e:
@@ -109,18 +96,61 @@ async def main_menu():
         elif choice == '3':
             print_header("Chức năng 3: Giám sát trực tiếp")
             try:
-                await live_monitor(client, user_keypair.pubkey())
+                emit_finalized = (await ainput("Thông báo lại khi giao dịch được finalized? (y/N): ")).strip().lower() == 'y'
+                await live_monitor(client, user_keypair.pubkey(), emit_finalized=emit_finalized, cache=cache)
             except KeyboardInterrupt:
                 print("\nĐã dừng giám sát.")
             except Exception as e:
                 print(f"[Lỗi] Đã xảy ra lỗi khi giám sát: {e}")
 
         elif choice == '4':
+            print_header("Chức năng 4: Quét khối")
+            try:
+                watched = {user_keypair.pubkey()}
+                for pubkey, _, _ in await cache.get_token_accounts():
+                    watched.add(pubkey)
+
+                start_slot = int((await ainput("Nhập slot bắt đầu: ")).strip())
+                end_slot_str = (await ainput("Nhập slot kết thúc (Enter = slot hiện tại): ")).strip()
+                end_slot = int(end_slot_str) if end_slot_str else (await client.get_slot()).value
+                if start_slot > end_slot:
+                    print("[Lỗi] Slot bắt đầu phải nhỏ hơn hoặc bằng slot kết thúc.")
+                else:
+                    await scan_block_range(client, watched, start_slot, end_slot)
+            except ValueError:
+                print("[Lỗi] Slot không hợp lệ. Vui lòng nhập số.")
+            except Exception as e:
+                print(f"[Lỗi] Đã xảy ra lỗi khi quét khối: {e}")
+
+        elif choice == '5':
+            print_header("Chức năng 5: Phân tích dòng tiền")
+            try:
+                import time
+                from analytics import load_transfer_table, print_flow_report
+
+                limit = int((await ainput("Số giao dịch gần nhất tối đa cho mỗi tài khoản (ví dụ: 1000): ")).strip())
+                if limit <= 0:
+                    print("[Lỗi] Vui lòng nhập một số dương.")
+                    continue
+
+                owned_accounts = [user_keypair.pubkey()] + [pk for pk, _, _ in await cache.get_token_accounts()]
+                table = await load_transfer_table(client, owned_accounts, await cache.get_ata_mints(), limit)
+
+                started = time.perf_counter()
+                print_flow_report(table)
+                print(f"\nĐã phân tích {len(table)} lệnh chuyển trong {time.perf_counter() - started:.3f}s.")
+            except ValueError:
+                print("[Lỗi] Số lượng không hợp lệ. Vui lòng nhập số.")
+            except Exception as e:
+                print(f"[Lỗi] Đã xảy ra lỗi khi phân tích: {e}")
+
+        elif choice == '6':
             break # Thoát khỏi vòng lặp
         
         else:
             print("[Lỗi] Lựa chọn không hợp lệ. Vui lòng chọn lại.")
 
+    await cache.close()
     await client.close()
     print("\nĐã ngắt kết nối!")
 
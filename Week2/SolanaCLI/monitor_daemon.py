@@ -0,0 +1,480 @@
+import asyncio
+import sys
+from collections import deque
+from datetime import datetime, timezone
+
+from solana.rpc.async_api import AsyncClient
+from solana.rpc.commitment import Confirmed
+from solana.rpc.types import TokenAccountOpts
+from solana.rpc.websocket_api import SubscriptionError, connect
+from solders.commitment_config import CommitmentLevel
+from solders.pubkey import Pubkey
+from solders.rpc.config import RpcTransactionLogsConfig, RpcTransactionLogsFilterMentions
+from solders.rpc.requests import LogsSubscribe
+from solders.rpc.responses import SubscriptionResult
+from spl.token.constants import TOKEN_PROGRAM_ID
+
+from solana_actions import (RETRY_DELAYS_SECONDS, _extract_account_lifecycle_events, _print_relevant_instructions,
+                            _split_account_lifecycle_events)
+from utils import ainput
+
+HTTP_URL = "https://api.devnet.solana.com"
+WS_URL = "wss://api.devnet.solana.com"
+
+# Số subscription tối đa trên một kết nối WebSocket (RPC công cộng thường giới hạn ở mức này).
+MAX_SUBSCRIPTIONS_PER_CONNECTION = 100
+# Số lệnh RPC HTTP chạy đồng thời khi nạp ví và lấy chi tiết giao dịch.
+MAX_CONCURRENT_RPC = 10
+# Số signature gần nhất được nhớ để tránh xử lý trùng lặp.
+MAX_REMEMBERED_SIGNATURES = 10_000
+RECONNECT_DELAY_SECONDS = 5
+# Số lần một tài khoản được chuyển sang kết nối khác khi bị từ chối đăng ký trước khi bỏ qua hẳn.
+MAX_SUBSCRIBE_ATTEMPTS = 3
+
+
+# ==============================================================================
+# --- 1. Chỉ mục tài khoản sở hữu ---
+# ==============================================================================
+class OwnedAccountIndex:
+    """
+    Chỉ mục băm từ mỗi tài khoản (ví chính hoặc tài khoản token) tới ví sở hữu nó,
+    kèm chỉ mục ngược từ ví tới tập tài khoản của ví đó.
+    """
+
+    def __init__(self):
+        self._wallet_of: dict[str, str] = {}
+        self._accounts_of: dict[str, set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._wallet_of)
+
+    def __contains__(self, account_str: str) -> bool:
+        return account_str in self._wallet_of
+
+    def wallets(self) -> list[str]:
+        return list(self._accounts_of)
+
+    def has_wallet(self, wallet_str: str) -> bool:
+        return wallet_str in self._accounts_of
+
+    def wallet_of(self, account_str: str) -> str | None:
+        return self._wallet_of.get(account_str)
+
+    def accounts_of(self, wallet_str: str) -> set[str]:
+        return self._accounts_of.get(wallet_str, set())
+
+    def add_account(self, wallet_str: str, account_str: str) -> bool:
+        """Gắn một tài khoản vào ví. Trả về True nếu tài khoản chưa có trong chỉ mục."""
+        is_new = account_str not in self._wallet_of
+        self._wallet_of[account_str] = wallet_str
+        self._accounts_of.setdefault(wallet_str, set()).add(account_str)
+        return is_new
+
+    def remove_account(self, account_str: str) -> str | None:
+        """Gỡ một tài khoản khỏi chỉ mục và trả về ví từng sở hữu nó."""
+        wallet_str = self._wallet_of.pop(account_str, None)
+        if wallet_str is not None:
+            self._accounts_of.get(wallet_str, set()).discard(account_str)
+        return wallet_str
+
+    def remove_wallet(self, wallet_str: str) -> set[str]:
+        """Gỡ một ví cùng mọi tài khoản của nó, trả về các tài khoản đã gỡ."""
+        accounts = self._accounts_of.pop(wallet_str, set())
+        for account_str in accounts:
+            self._wallet_of.pop(account_str, None)
+        return accounts
+
+    def attribute(self, account_keys) -> dict[str, set[str]]:
+        """
+        Gán các account key của một giao dịch cho các ví bị ảnh hưởng.
+        Mỗi key chỉ cần đúng một lần tra cứu trong bảng băm.
+        """
+        affected: dict[str, set[str]] = {}
+        for key in account_keys:
+            key_str = str(key)
+            wallet_str = self._wallet_of.get(key_str)
+            if wallet_str is not None:
+                affected.setdefault(wallet_str, set()).add(key_str)
+        return affected
+
+
+def load_watch_list(path: str) -> list[Pubkey]:
+    """Đọc danh sách ví cần theo dõi: mỗi dòng một public key, bỏ qua dòng trống và dòng bắt đầu bằng '#'."""
+    wallets = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                wallets.append(Pubkey.from_string(line))
+            except ValueError:
+                print(f"[Cảnh báo] Dòng {line_no}: địa chỉ ví không hợp lệ, bỏ qua: {line}")
+    return wallets
+
+
+# ==============================================================================
+# --- 2. Kết nối WebSocket chứa nhiều subscription ---
+# ==============================================================================
+class _SubscriptionConnection:
+    """Một kết nối WebSocket mang tối đa `capacity` subscription logsSubscribe."""
+
+    def __init__(self, monitor: "MultiWalletMonitor", conn_id: int, capacity: int):
+        self.monitor = monitor
+        self.conn_id = conn_id
+        self.capacity = capacity
+        self.accounts: set[str] = set()
+        self._subscription_of: dict[str, int] = {}   # tài khoản -> subscription id
+        self._account_of: dict[int, str] = {}        # subscription id -> tài khoản
+        self._pending: dict[int, str] = {}           # request id -> tài khoản
+        self._websocket = None
+        self._ready = asyncio.Event()
+        self.task: asyncio.Task | None = None
+
+    @property
+    def free_slots(self) -> int:
+        return self.capacity - len(self.accounts)
+
+    async def subscribe(self, account_str: str):
+        self.accounts.add(account_str)
+        # Nếu kết nối chưa sẵn sàng, run() sẽ đăng ký tài khoản này ngay khi kết nối xong.
+        if self._ready.is_set():
+            await self._send_subscribe(account_str)
+
+    async def unsubscribe(self, account_str: str):
+        self.accounts.discard(account_str)
+        subscription_id = self._subscription_of.pop(account_str, None)
+        if subscription_id is None:
+            return
+        self._account_of.pop(subscription_id, None)
+        if self._websocket is not None:
+            try:
+                await self._websocket.logs_unsubscribe(subscription_id)
+            except Exception as e:
+                print(f"[Kết nối #{self.conn_id}] Không thể hủy đăng ký {account_str}: {e}")
+
+    async def _send_subscribe(self, account_str: str):
+        websocket = self._websocket
+        if websocket is None:
+            return
+        # Tự dựng yêu cầu để biết trước request id, từ đó ghép kết quả trả về với tài khoản.
+        req_id = websocket.increment_counter_and_get_id()
+        self._pending[req_id] = account_str
+        req = LogsSubscribe(
+            RpcTransactionLogsFilterMentions(Pubkey.from_string(account_str)),
+            RpcTransactionLogsConfig(commitment=CommitmentLevel.Confirmed),
+            req_id,
+        )
+        await websocket.send_data(req)
+
+    async def run(self):
+        """Giữ kết nối sống, tự kết nối lại và đăng ký lại mọi tài khoản khi bị ngắt."""
+        while True:
+            try:
+                async with connect(self.monitor.ws_url) as websocket:
+                    self._websocket = websocket
+                    self._subscription_of.clear()
+                    self._account_of.clear()
+                    self._pending.clear()
+                    self._ready.set()
+                    for account_str in list(self.accounts):
+                        await self._send_subscribe(account_str)
+                    while True:
+                        try:
+                            messages = await websocket.recv()
+                        except SubscriptionError as e:
+                            # solana-py báo lỗi đăng ký bằng ngoại lệ trong recv(); kết nối vẫn dùng được.
+                            await self._handle_subscription_error(e)
+                            continue
+                        for msg_item in messages or []:
+                            self._dispatch(msg_item)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[Kết nối #{self.conn_id}] Lỗi: {e}. Kết nối lại sau {RECONNECT_DELAY_SECONDS}s...")
+            finally:
+                self._ready.clear()
+                self._websocket = None
+            await asyncio.sleep(RECONNECT_DELAY_SECONDS)
+
+    async def _handle_subscription_error(self, error: SubscriptionError):
+        account_str = self._pending.pop(getattr(error.subscription, 'id', None), None)
+        print(f"[Kết nối #{self.conn_id}] Đăng ký thất bại cho {account_str}: {error.err}")
+        if account_str is None or account_str not in self.accounts:
+            return
+        # Thường là giới hạn subscription của máy chủ: coi kết nối này đã đầy và chuyển tài khoản sang kết nối khác.
+        self.accounts.discard(account_str)
+        self.capacity = len(self.accounts)
+        await self.monitor._relocate_account(account_str, self)
+
+    def _dispatch(self, msg_item):
+        if isinstance(msg_item, SubscriptionResult):
+            account_str = self._pending.pop(msg_item.id, None)
+            if account_str is None:
+                return
+            if account_str not in self.accounts:
+                # Tài khoản đã bị gỡ trong lúc chờ xác nhận đăng ký.
+                asyncio.create_task(self._websocket.logs_unsubscribe(msg_item.result))
+                return
+            self._subscription_of[account_str] = msg_item.result
+            self._account_of[msg_item.result] = account_str
+            self.monitor._subscribe_failures.pop(account_str, None)
+            return
+
+        result = getattr(msg_item, 'result', None)
+        if result is not None and hasattr(result, 'value') and hasattr(result.value, 'signature'):
+            self.monitor.schedule_signature(result.value.signature)
+
+
+# ==============================================================================
+# --- 3. Daemon giám sát nhiều ví ---
+# ==============================================================================
+class MultiWalletMonitor:
+    """
+    Giám sát đồng thời nhiều ví trong một tiến trình.
+    Các subscription được chia đều trên nhiều kết nối WebSocket, mỗi kết nối
+    tối đa `max_subscriptions_per_connection` tài khoản.
+    """
+
+    def __init__(
+        self,
+        http_client: AsyncClient,
+        ws_url: str = WS_URL,
+        max_subscriptions_per_connection: int = MAX_SUBSCRIPTIONS_PER_CONNECTION,
+    ):
+        self.http_client = http_client
+        self.ws_url = ws_url
+        self.max_subscriptions_per_connection = max_subscriptions_per_connection
+        self.index = OwnedAccountIndex()
+        self._connections: list[_SubscriptionConnection] = []
+        self._connection_of: dict[str, _SubscriptionConnection] = {}
+        self._rpc_semaphore = asyncio.Semaphore(MAX_CONCURRENT_RPC)
+        self._index_lock = asyncio.Lock()
+        self._seen_signatures: set = set()
+        self._seen_order: deque = deque()
+        self._tasks: set[asyncio.Task] = set()
+        self._subscribe_failures: dict[str, int] = {}
+
+    # --- Quản lý subscription ---
+    def _connection_with_room(self) -> _SubscriptionConnection:
+        for conn in self._connections:
+            if conn.free_slots > 0:
+                return conn
+        conn = _SubscriptionConnection(self, len(self._connections) + 1, self.max_subscriptions_per_connection)
+        conn.task = asyncio.create_task(conn.run())
+        self._connections.append(conn)
+        return conn
+
+    async def _watch_account(self, account_str: str):
+        if account_str in self._connection_of:
+            return
+        conn = self._connection_with_room()
+        self._connection_of[account_str] = conn
+        await conn.subscribe(account_str)
+
+    async def _relocate_account(self, account_str: str, failed_conn: _SubscriptionConnection):
+        """Đăng ký lại trên kết nối khác một tài khoản mà `failed_conn` không đăng ký được."""
+        if self._connection_of.get(account_str) is not failed_conn:
+            return  # Tài khoản đã bị gỡ hoặc đã được chuyển đi.
+        del self._connection_of[account_str]
+        failures = self._subscribe_failures.get(account_str, 0) + 1
+        if failures >= MAX_SUBSCRIBE_ATTEMPTS:
+            self._subscribe_failures.pop(account_str, None)
+            print(f"[Cảnh báo] Bỏ qua {account_str} sau {failures} lần đăng ký thất bại; tài khoản này không được giám sát.")
+            return
+        self._subscribe_failures[account_str] = failures
+        await self._watch_account(account_str)
+
+    async def _unwatch_account(self, account_str: str):
+        conn = self._connection_of.pop(account_str, None)
+        if conn is not None:
+            await conn.unsubscribe(account_str)
+
+    # --- Thêm / gỡ ví khi đang chạy ---
+    async def _fetch_token_accounts(self, wallet_pubkey: Pubkey) -> list[str]:
+        async with self._rpc_semaphore:
+            resp = await self.http_client.get_token_accounts_by_owner(
+                wallet_pubkey, TokenAccountOpts(program_id=TOKEN_PROGRAM_ID)
+            )
+        return [str(acc_info.pubkey) for acc_info in resp.value or []]
+
+    async def add_wallet(self, wallet_pubkey: Pubkey) -> int:
+        """Thêm một ví (và các tài khoản token của nó) vào danh sách theo dõi. Trả về số tài khoản được theo dõi."""
+        wallet_str = str(wallet_pubkey)
+        try:
+            token_accounts = await self._fetch_token_accounts(wallet_pubkey)
+        except Exception as e:
+            print(f"Cảnh báo: Không thể lấy các tài khoản token của {wallet_str}: {e}")
+            token_accounts = []
+
+        async with self._index_lock:
+            new_accounts = [
+                account_str for account_str in [wallet_str, *token_accounts]
+                if self.index.add_account(wallet_str, account_str)
+            ]
+        for account_str in new_accounts:
+            await self._watch_account(account_str)
+        return len(self.index.accounts_of(wallet_str))
+
+    async def remove_wallet(self, wallet_pubkey: Pubkey) -> int:
+        """Gỡ một ví khỏi danh sách theo dõi. Trả về số tài khoản đã hủy đăng ký."""
+        async with self._index_lock:
+            removed = self.index.remove_wallet(str(wallet_pubkey))
+        for account_str in removed:
+            await self._unwatch_account(account_str)
+        return len(removed)
+
+    async def load_wallets(self, wallets: list[Pubkey]):
+        """Nạp đồng thời toàn bộ danh sách ví ban đầu."""
+        await asyncio.gather(*(self.add_wallet(w) for w in wallets))
+
+    async def _apply_lifecycle_events(self, events: dict[str, tuple[str, str]]):
+        """Đăng ký tài khoản token vừa được tạo cho một ví đang theo dõi, hủy đăng ký tài khoản vừa bị đóng."""
+        to_watch, to_unwatch = [], []
+        async with self._index_lock:
+            for account_str, (kind, owner) in events.items():
+                if kind == 'open' and self.index.has_wallet(owner):
+                    if self.index.add_account(owner, account_str):
+                        to_watch.append(account_str)
+                elif kind == 'close' and self.index.wallet_of(account_str) == owner and account_str != owner:
+                    self.index.remove_account(account_str)
+                    to_unwatch.append(account_str)
+        for account_str in to_watch:
+            print(f"  [Giám sát] Tài khoản token mới {account_str} của ví {events[account_str][1]}.")
+            await self._watch_account(account_str)
+        for account_str in to_unwatch:
+            print(f"  [Giám sát] Tài khoản token {account_str} đã bị đóng.")
+            await self._unwatch_account(account_str)
+
+    # --- Xử lý thông báo ---
+    def schedule_signature(self, signature):
+        if signature in self._seen_signatures:
+            return
+        self._seen_signatures.add(signature)
+        self._seen_order.append(signature)
+        if len(self._seen_order) > MAX_REMEMBERED_SIGNATURES:
+            self._seen_signatures.discard(self._seen_order.popleft())
+
+        task = asyncio.create_task(self._process_signature(signature))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fetch_confirmed_transaction(self, signature):
+        """Lấy giao dịch ở mức 'confirmed', thử lại với thời gian chờ tăng dần nếu RPC chưa trả về."""
+        tx_response = None
+        for delay in (*RETRY_DELAYS_SECONDS, None):
+            try:
+                async with self._rpc_semaphore:
+                    tx_response = await self.http_client.get_transaction(
+                        signature, encoding="jsonParsed", max_supported_transaction_version=0, commitment=Confirmed
+                    )
+            except Exception:
+                tx_response = None
+            if (tx_response and tx_response.value) or delay is None:
+                return tx_response
+            await asyncio.sleep(delay)
+
+    async def _process_signature(self, signature):
+        try:
+            tx_response = await self._fetch_confirmed_transaction(signature)
+            if not (tx_response and tx_response.value):
+                print(f"\n[{signature}] Không thể lấy chi tiết giao dịch sau {len(RETRY_DELAYS_SECONDS) + 1} lần thử.")
+                return
+
+            tx_data = tx_response.value
+            transaction_detail = tx_data.transaction
+            meta = getattr(transaction_detail, 'meta', None)
+            message = getattr(transaction_detail.transaction, 'message', None)
+            if not (message and hasattr(message, 'account_keys')):
+                return
+
+            # Tài khoản mới được thêm trước khi gán giao dịch cho ví; tài khoản bị đóng chỉ được gỡ sau khi đã in.
+            opened_events, closed_events = _split_account_lifecycle_events(_extract_account_lifecycle_events(message, meta))
+            if opened_events:
+                await self._apply_lifecycle_events(opened_events)
+
+            affected = self.index.attribute(acc.pubkey for acc in message.account_keys)
+            if affected:
+                now = datetime.now(timezone.utc)
+                print(f"\nGiao dịch {signature} (slot {tx_data.slot}) lúc {now.strftime('%Y-%m-%d %H:%M:%S %Z')}")
+                for wallet_str, accounts_involved in affected.items():
+                    print(f"  [Ví {wallet_str}] Tài khoản bị ảnh hưởng: {', '.join(sorted(accounts_involved))}")
+                    await _print_relevant_instructions(
+                        message, meta, wallet_str, self.index.accounts_of(wallet_str), self.http_client
+                    )
+
+            if closed_events:
+                await self._apply_lifecycle_events(closed_events)
+        except Exception as e:
+            print(f"\n[{signature}] Lỗi khi xử lý giao dịch: {e}")
+
+    def status(self) -> str:
+        per_conn = ", ".join(f"#{c.conn_id}: {len(c.accounts)}" for c in self._connections)
+        return (f"{len(self.index.wallets())} ví, {len(self.index)} tài khoản, "
+                f"{len(self._connections)} kết nối ({per_conn})")
+
+    async def close(self):
+        for task in list(self._tasks) + [c.task for c in self._connections if c.task]:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *(c.task for c in self._connections if c.task), return_exceptions=True)
+
+
+# ==============================================================================
+# --- 4. Vòng lặp điều khiển ---
+# ==============================================================================
+def _print_commands():
+    print("Lệnh: 'add <pubkey>', 'remove <pubkey>', 'status', 'quit'")
+
+
+async def run_daemon(watch_list_path: str | None = None):
+    client = AsyncClient(HTTP_URL)
+    monitor = MultiWalletMonitor(client)
+    try:
+        if watch_list_path:
+            wallets = load_watch_list(watch_list_path)
+            print(f"Đang nạp {len(wallets)} ví từ {watch_list_path}...")
+            await monitor.load_wallets(wallets)
+        print(f"Đang giám sát: {monitor.status()}")
+        _print_commands()
+
+        while True:
+            try:
+                line = (await ainput()).strip()
+            except EOFError:
+                # Stdin đã đóng (nohup, systemd, pipe): tiếp tục giám sát không cần lệnh, tới khi tiến trình bị dừng.
+                print("Stdin đã đóng; tiếp tục giám sát mà không nhận lệnh. Dừng bằng Ctrl+C hoặc tín hiệu.")
+                await asyncio.Event().wait()
+            if not line:
+                continue
+            command, _, arg = line.partition(" ")
+            command = command.lower()
+            if command in ("quit", "exit"):
+                break
+            if command == "status":
+                print(monitor.status())
+                continue
+            if command not in ("add", "remove"):
+                _print_commands()
+                continue
+            try:
+                wallet_pubkey = Pubkey.from_string(arg.strip())
+            except ValueError:
+                print(f"[Lỗi] Địa chỉ ví không hợp lệ: {arg}")
+                continue
+            if command == "add":
+                count = await monitor.add_wallet(wallet_pubkey)
+                print(f"Đã thêm {wallet_pubkey} ({count} tài khoản).")
+            else:
+                count = await monitor.remove_wallet(wallet_pubkey)
+                print(f"Đã gỡ {wallet_pubkey} ({count} tài khoản).")
+    finally:
+        await monitor.close()
+        await client.close()
+        print("\nĐã dừng daemon giám sát.")
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(run_daemon(sys.argv[1] if len(sys.argv) > 1 else None))
+    except KeyboardInterrupt:
+        print("\nĐã đóng chương trình.")
@@ -1,8 +1,12 @@
 import asyncio
+import heapq
+import itertools
+import time
 from datetime import datetime, timezone
 
 from solders.transaction import VersionedTransaction
 from solana.rpc.async_api import AsyncClient
+from solana.rpc.commitment import Confirmed
 from solana.rpc.websocket_api import connect
 from solana.rpc.types import TokenAccountOpts, TxOpts
 from solders.instruction import Instruction
@@ -14,19 +18,95 @@ from solders.signature import Signature
 from solders.system_program import ID as SYSTEM_PROGRAM_ID
 from solders.system_program import TransferParams
 from solders.system_program import transfer as sol_transfer
+from solders.transaction_status import TransactionConfirmationStatus
 from spl.token._layouts import MINT_LAYOUT
-from spl.token.constants import TOKEN_PROGRAM_ID
+from spl.token.constants import ASSOCIATED_TOKEN_PROGRAM_ID, TOKEN_PROGRAM_ID
 from spl.token.instructions import (TransferCheckedParams,
                                     create_associated_token_account,
+                                    create_idempotent_associated_token_account,
                                     get_associated_token_address,
                                     transfer_checked)
 
+from latency import LatencyTracer
+from utils import ainput
+
 LAMPORTS_PER_SOL = 1_000_000_000
+# Phí cơ bản cho mỗi chữ ký; giao dịch chuyển tiền ở đây chỉ có một chữ ký.
+BASE_FEE_LAMPORTS = 5_000
+TOKEN_ACCOUNT_SIZE = 165
+
+# Khoảng chờ (giây) trước mỗi lần thử lại khi giao dịch chưa truy vấn được ở mức 'confirmed'.
+RETRY_DELAYS_SECONDS = (0.5, 1, 2, 4, 8, 16)
+# Chu kỳ kiểm tra trạng thái finalized và thời gian tối đa chờ một giao dịch được finalized.
+FINALIZATION_POLL_SECONDS = 5
+FINALIZATION_TIMEOUT_SECONDS = 120
+# getSignatureStatuses nhận tối đa 256 signature mỗi lần gọi.
+MAX_SIGNATURES_PER_STATUS_REQUEST = 256
+
+# Số lệnh getBlock chạy đồng thời khi quét khối.
+DEFAULT_SCAN_CONCURRENCY = 8
+
+# Các chỉ thị làm xuất hiện hoặc biến mất một tài khoản token.
+_ATA_CREATE_TYPES = {'create', 'createIdempotent'}
+_TOKEN_INIT_TYPES = {'initializeAccount', 'initializeAccount2', 'initializeAccount3'}
 
 # ==============================================================================
 # --- 1. Chức năng Chuyển tiền (từ transaction.py) ---
 # ==============================================================================
-async def transfer_assets(client: AsyncClient, sender: Keypair, receiver_str: str, mint_address_str: str, amount_to_send: float):
+def _validate_transfer_locally(
+    cache, sender_pubkey: Pubkey, lamports_out: int, token_source: Pubkey | None = None, token_amount: int = 0,
+    sol_receiver: Pubkey | None = None
+) -> tuple[bool | None, str]:
+    """
+    Kiểm tra một giao dịch chuyển tiền dựa trên trạng thái tài khoản trong bộ nhớ đệm.
+    Với giao dịch chuyển SOL, `sol_receiver` là người nhận: số dư sau giao dịch của họ cũng phải đạt mức miễn rent.
+    Trả về (True, "") nếu hợp lệ, (False, lý do) nếu chắc chắn thất bại,
+    hoặc (None, lý do) nếu bộ nhớ đệm đã cũ và cần mô phỏng đầy đủ trên RPC.
+    """
+    wallet_state = cache.fresh_state(sender_pubkey)
+    if wallet_state is None:
+        return None, "trạng thái ví đã cũ"
+    _, wallet_lamports, _ = wallet_state
+
+    remaining = wallet_lamports - lamports_out - BASE_FEE_LAMPORTS
+    if remaining < 0:
+        return False, (f"Không đủ SOL: cần {(lamports_out + BASE_FEE_LAMPORTS) / LAMPORTS_PER_SOL:.9f} SOL, "
+                       f"hiện có {wallet_lamports / LAMPORTS_PER_SOL:.9f} SOL")
+    min_wallet_balance = cache.rent_exemptions.get(0)
+    if min_wallet_balance is None:
+        return None, "chưa có giá trị rent"
+    if 0 < remaining < min_wallet_balance:
+        return False, (f"Số dư còn lại {remaining / LAMPORTS_PER_SOL:.9f} SOL thấp hơn mức miễn rent "
+                       f"({min_wallet_balance / LAMPORTS_PER_SOL:.9f} SOL)")
+
+    if sol_receiver is not None and sol_receiver != sender_pubkey:
+        receiver_state = cache.fresh_state(sol_receiver)
+        if receiver_state is None:
+            return None, "trạng thái tài khoản người nhận đã cũ"
+        _, receiver_lamports, _ = receiver_state
+        if 0 < receiver_lamports + lamports_out < min_wallet_balance:
+            return False, (f"Số dư của người nhận sau giao dịch ({(receiver_lamports + lamports_out) / LAMPORTS_PER_SOL:.9f} SOL) "
+                           f"thấp hơn mức miễn rent ({min_wallet_balance / LAMPORTS_PER_SOL:.9f} SOL)")
+
+    if token_source is not None:
+        source_state = cache.fresh_state(token_source)
+        if source_state is None:
+            return None, "trạng thái tài khoản token nguồn đã cũ"
+        source_exists, _, source_amount = source_state
+        if not source_exists or source_amount is None:
+            return False, f"Tài khoản token nguồn {token_source} không tồn tại"
+        if source_amount < token_amount:
+            return False, f"Không đủ token: cần {token_amount}, hiện có {source_amount} (đơn vị nhỏ nhất)"
+
+    return True, ""
+
+
+async def transfer_assets(client: AsyncClient, sender: Keypair, receiver_str: str, mint_address_str: str, amount_to_send: float, cache=None, fast: bool = False):
+    """
+    Chuyển SOL hoặc SPL token. Nếu có `cache` (WalletCache), blockhash và số thập phân của mint được lấy từ bộ nhớ đệm.
+    Với `fast=True`, giao dịch được kiểm tra cục bộ dựa trên bộ nhớ đệm và gửi với skip_preflight;
+    nếu bộ nhớ đệm đã cũ, giao dịch quay về mô phỏng đầy đủ trên RPC.
+    """
     print("\nĐang xử lý giao dịch, vui lòng chờ...")
     try:
         receiver = Pubkey.from_string(receiver_str)
@@ -34,8 +114,11 @@ async def transfer_assets(client: AsyncClient, sender: Keypair, receiver_str: st
         print(f"[Lỗi] Địa chỉ người nhận không hợp lệ: {receiver_str}")
         return
 
-    latest_blockhash_resp = await client.get_latest_blockhash()
-    blockhash = latest_blockhash_resp.value.blockhash
+    if cache is not None:
+        blockhash = (await cache.get_latest_blockhash()).blockhash
+    else:
+        latest_blockhash_resp = await client.get_latest_blockhash()
+        blockhash = latest_blockhash_resp.value.blockhash
     
     instructions = []
     
@@ -46,6 +129,12 @@ async def transfer_assets(client: AsyncClient, sender: Keypair, receiver_str: st
             TransferParams(from_pubkey=sender.pubkey(), to_pubkey=receiver, lamports=lamports)
         )
         instructions.append(transfer_ix)
+        lamports_out, token_source, token_amount = lamports, None, 0
+        sol_receiver = receiver
+        touched_accounts = [sender.pubkey(), receiver]
+        if fast and cache is not None:
+            # Nạp trạng thái người nhận (nếu đã cũ) để kiểm tra mức miễn rent của họ.
+            await cache.get_account_state(receiver)
     else:
         print("Giao dịch SPL Token...")
         try:
@@ -55,11 +144,14 @@ async def transfer_assets(client: AsyncClient, sender: Keypair, receiver_str: st
             return
             
         try:
-            mint_account_info = await client.get_account_info(mint_address)
-            if mint_account_info.value is None:
-                raise ValueError("Không tìm thấy tài khoản mint")
-            mint_info = MINT_LAYOUT.parse(mint_account_info.value.data)
-            decimals = mint_info.decimals
+            if cache is not None:
+                decimals = await cache.get_mint_decimals(mint_address)
+            else:
+                mint_account_info = await client.get_account_info(mint_address)
+                if mint_account_info.value is None:
+                    raise ValueError("Không tìm thấy tài khoản mint")
+                mint_info = MINT_LAYOUT.parse(mint_account_info.value.data)
+                decimals = mint_info.decimals
         except Exception as e:
             print(f"[Lỗi] Không thể lấy thông tin token: {e}")
             return
@@ -68,13 +160,21 @@ async def transfer_assets(client: AsyncClient, sender: Keypair, receiver_str: st
         sender_ata = get_associated_token_address(sender.pubkey(), mint_address)
         receiver_ata = get_associated_token_address(receiver, mint_address)
 
-        receiver_ata_info = await client.get_account_info(receiver_ata)
-        if receiver_ata_info.value is None:
+        if fast and cache is not None:
+            receiver_ata_exists, _, _ = await cache.get_account_state(receiver_ata)
+        else:
+            receiver_ata_info = await client.get_account_info(receiver_ata)
+            receiver_ata_exists = receiver_ata_info.value is not None
+        lamports_out = 0
+        if not receiver_ata_exists:
             print("Tài khoản token của người nhận không tồn tại. Đang tạo...")
-            create_ata_ix = create_associated_token_account(
-                payer=sender.pubkey(), owner=receiver, mint=mint_address
-            )
+            # Ở chế độ gửi nhanh, trạng thái ATA lấy từ bộ nhớ đệm và không có mô phỏng: nếu ATA được tạo
+            # trong lúc đó, chỉ thị idempotent vẫn thành công thay vì làm giao dịch thất bại mà vẫn mất phí.
+            create_ata = create_idempotent_associated_token_account if fast else create_associated_token_account
+            create_ata_ix = create_ata(payer=sender.pubkey(), owner=receiver, mint=mint_address)
             instructions.append(create_ata_ix)
+            if fast and cache is not None:
+                lamports_out = await cache.get_rent_exemption(TOKEN_ACCOUNT_SIZE)
 
         transfer_ix = transfer_checked(
             TransferCheckedParams(
@@ -89,6 +189,24 @@ async def transfer_assets(client: AsyncClient, sender: Keypair, receiver_str: st
             )
         )
         instructions.append(transfer_ix)
+        token_source, token_amount = sender_ata, amount
+        sol_receiver = None
+        touched_accounts = [sender.pubkey(), sender_ata, receiver_ata]
+
+    skip_preflight = False
+    if fast and cache is not None:
+        is_valid, reason = _validate_transfer_locally(
+            cache, sender.pubkey(), lamports_out, token_source, token_amount, sol_receiver
+        )
+        if is_valid is False:
+            print(f"[Lỗi] Kiểm tra cục bộ thất bại: {reason}")
+            return
+        if is_valid:
+            print("Kiểm tra cục bộ thành công. Gửi nhanh (bỏ qua mô phỏng trên RPC)...")
+            skip_preflight = True
+        else:
+            print(f"Bộ nhớ đệm chưa đủ mới ({reason}). Dùng mô phỏng đầy đủ trên RPC.")
+            cache.refresh_in_background(touched_accounts)
 
     msg = MessageV0.try_compile(
         payer=sender.pubkey(),
@@ -99,10 +217,12 @@ async def transfer_assets(client: AsyncClient, sender: Keypair, receiver_str: st
     tx = VersionedTransaction(msg, [sender])
 
     try:
-        resp = await client.send_transaction(tx, opts=TxOpts(skip_preflight=False))
+        resp = await client.send_transaction(tx, opts=TxOpts(skip_preflight=skip_preflight))
         print(f"Giao dịch đã được gửi thành công!")
         print(f"   Signature: {resp.value}")
         print(f"   Xem trên Solana Explorer: https://explorer.solana.com/tx/{resp.value}?cluster=devnet")
+        if cache is not None:
+            cache.invalidate(resp.value, touched_accounts, blockhash)
     except Exception as e:
         print(f"[Lỗi] Gửi giao dịch thất bại: {e}")
 
@@ -110,19 +230,58 @@ async def transfer_assets(client: AsyncClient, sender: Keypair, receiver_str: st
 # ==============================================================================
 # --- 2. Chức năng Lịch sử Giao dịch (từ getHistory.py) ---
 # ==============================================================================
-async def get_transaction_history(client: AsyncClient, address: Pubkey, limit: int):
+def _print_transaction_summary(transaction_detail, block_time: int | None):
+    """In thời gian, trạng thái, phí và các lệnh chuyển SOL / SPL token của một giao dịch đã giải mã (jsonParsed)."""
+    meta = transaction_detail.meta
+
+    if block_time:
+        dt_object = datetime.fromtimestamp(block_time, timezone.utc)
+        print(f"  Thời gian: {dt_object.strftime('%Y-%m-%d %H:%M:%S %Z')}")
+
+    status = "Thất bại" if meta and meta.err else "Thành công"
+    print(f"  Trạng thái: {status}")
+
+    if meta:
+        print(f"  Phí: {meta.fee / LAMPORTS_PER_SOL:.9f} SOL")
+
+    message = transaction_detail.transaction.message
+    if message and message.instructions:
+        print("  Chi tiết:")
+        for instruction in message.instructions:
+            if not hasattr(instruction, 'parsed'): continue
+            parsed = instruction.parsed
+            if isinstance(parsed, dict) and parsed.get('type') == 'transfer':
+                info = parsed.get('info', {})
+                lamports = info.get('lamports', 0)
+                print(f"    - Chuyển {lamports / LAMPORTS_PER_SOL:.9f} SOL")
+                print(f"      Từ: {info.get('source')}")
+                print(f"      Đến: {info.get('destination')}")
+            elif isinstance(parsed, dict) and parsed.get('type') == 'transferChecked':
+                info = parsed.get('info', {})
+                amount = info.get('tokenAmount', {}).get('uiAmountString', 'N/A')
+                print(f"    - Chuyển {amount} SPL Token")
+                print(f"      Token: {info.get('mint')}")
+                print(f"      Từ ATA: {info.get('source')}")
+                print(f"      Đến ATA: {info.get('destination')}")
+
+
+async def get_transaction_history(client: AsyncClient, address: Pubkey, limit: int, cache=None):
     print(f"\nĐang lấy {limit} giao dịch gần nhất cho {address}...")
     
-    response = await client.get_signatures_for_address(address, limit=limit)
-    if not response.value:
+    signatures = await cache.get_signatures(address, limit) if cache is not None else None
+    if signatures is None:
+        response = await client.get_signatures_for_address(address, limit=limit)
+        signatures = response.value
+    if not signatures:
         print("Không tìm thấy giao dịch nào cho địa chỉ này.")
         return
 
-    for i, sig_info in enumerate(response.value):
+    for i, sig_info in enumerate(signatures):
         print(f"\n({i+1}/{limit}) Lấy thông tin giao dịch: {sig_info.signature}")
         
+        # Signature có thể mới ở mức 'confirmed' (từ bộ nhớ đệm), nên lấy chi tiết ở cùng mức đó.
         tx_response = await client.get_transaction(
-            sig_info.signature, encoding="jsonParsed", max_supported_transaction_version=0
+            sig_info.signature, encoding="jsonParsed", max_supported_transaction_version=0, commitment=Confirmed
         )
         
         print("-" * 50)
@@ -131,38 +290,7 @@ async def get_transaction_history(client: AsyncClient, address: Pubkey, limit: i
             continue
 
         tx_data = tx_response.value
-        transaction_detail = tx_data.transaction
-        meta = transaction_detail.meta
-        
-        if tx_data.block_time:
-            dt_object = datetime.fromtimestamp(tx_data.block_time, timezone.utc)
-            print(f"  Thời gian: {dt_object.strftime('%Y-%m-%d %H:%M:%S %Z')}")
-        
-        status = "Thất bại" if meta and meta.err else "Thành công"
-        print(f"  Trạng thái: {status}")
-        
-        if meta:
-             print(f"  Phí: {meta.fee / LAMPORTS_PER_SOL:.9f} SOL")
-
-        message = transaction_detail.transaction.message
-        if message and message.instructions:
-            print("  Chi tiết:")
-            for instruction in message.instructions:
-                if not hasattr(instruction, 'parsed'): continue
-                parsed = instruction.parsed
-                if isinstance(parsed, dict) and parsed.get('type') == 'transfer':
-                    info = parsed.get('info', {})
-                    lamports = info.get('lamports', 0)
-                    print(f"    - Chuyển {lamports / LAMPORTS_PER_SOL:.9f} SOL")
-                    print(f"      Từ: {info.get('source')}")
-                    print(f"      Đến: {info.get('destination')}")
-                elif isinstance(parsed, dict) and parsed.get('type') == 'transferChecked':
-                    info = parsed.get('info', {})
-                    amount = info.get('tokenAmount', {}).get('uiAmountString', 'N/A')
-                    print(f"    - Chuyển {amount} SPL Token")
-                    print(f"      Token: {info.get('mint')}")
-                    print(f"      Từ ATA: {info.get('source')}")
-                    print(f"      Đến ATA: {info.get('destination')}")
+        _print_transaction_summary(tx_data.transaction, tx_data.block_time)
         print("-" * 50)
 
 # ==============================================================================
@@ -248,8 +376,114 @@ async def _parse_and_print_instruction(
     return is_relevant
 
 
+async def _print_relevant_instructions(
+    message, meta, main_wallet_str: str, owned_accounts_strs: set[str], http_client: AsyncClient
+) -> int:
+    """Duyệt các chỉ thị cấp cao nhất và chỉ thị bên trong, trả về số chỉ thị có liên quan."""
+    total_relevant_instructions = 0
+
+    # Phân tích các chỉ thị cấp cao nhất
+    if message and hasattr(message, 'instructions') and message.instructions:
+        for idx, instruction in enumerate(message.instructions):
+            has_inner = meta and any(ix_set.index == idx for ix_set in meta.inner_instructions or [])
+            if not has_inner:
+                was_relevant = await _parse_and_print_instruction(instruction, main_wallet_str, owned_accounts_strs, http_client, "  -> ")
+                if was_relevant:
+                    total_relevant_instructions += 1
+
+    # Phân tích các chỉ thị bên trong
+    if meta and hasattr(meta, 'inner_instructions') and meta.inner_instructions:
+        for inner_instruction_set in meta.inner_instructions:
+            print(f"  - Chỉ thị từ Program Call #{inner_instruction_set.index + 1}:")
+            for sub_idx, instruction in enumerate(inner_instruction_set.instructions):
+                 was_relevant = await _parse_and_print_instruction(instruction, main_wallet_str, owned_accounts_strs, http_client, f"    {sub_idx+1}. ")
+                 if was_relevant:
+                    total_relevant_instructions += 1
+
+    return total_relevant_instructions
+
+
+def _extract_account_lifecycle_events(message, meta) -> dict[str, tuple[str, str]]:
+    """
+    Tìm các chỉ thị tạo/đóng tài khoản token trong một giao dịch đã giải mã.
+    Trả về {tài khoản: (loại, chủ sở hữu)} với loại là 'open' hoặc 'close';
+    nếu một tài khoản vừa được tạo vừa bị đóng, sự kiện sau cùng được giữ lại.
+    """
+    events: dict[str, tuple[str, str]] = {}
+    if meta is not None and getattr(meta, 'err', None):
+        return events  # Giao dịch thất bại không thay đổi trạng thái tài khoản.
+
+    inner_by_index = {ix_set.index: ix_set.instructions for ix_set in (getattr(meta, 'inner_instructions', None) or [])}
+    ordered_instructions = []
+    for idx, instruction in enumerate(getattr(message, 'instructions', None) or []):
+        ordered_instructions.append(instruction)
+        ordered_instructions.extend(inner_by_index.get(idx, []))
+
+    for instruction in ordered_instructions:
+        parsed = getattr(instruction, 'parsed', None)
+        if not isinstance(parsed, dict):
+            continue
+        info = parsed.get('info', {})
+        instruction_type = parsed.get('type')
+        program_id = getattr(instruction, 'program_id', None)
+
+        if program_id == ASSOCIATED_TOKEN_PROGRAM_ID and instruction_type in _ATA_CREATE_TYPES:
+            account, owner = info.get('account'), info.get('wallet')
+            kind = 'open'
+        elif program_id == TOKEN_PROGRAM_ID and instruction_type in _TOKEN_INIT_TYPES:
+            account, owner = info.get('account'), info.get('owner')
+            kind = 'open'
+        elif program_id == TOKEN_PROGRAM_ID and instruction_type == 'closeAccount':
+            account, owner = info.get('account'), info.get('owner') or info.get('multisigOwner')
+            kind = 'close'
+        else:
+            continue
+        if account and owner:
+            events[account] = (kind, owner)
+    return events
+
+
+def _split_account_lifecycle_events(
+    events: dict[str, tuple[str, str]]
+) -> tuple[dict[str, tuple[str, str]], dict[str, tuple[str, str]]]:
+    """
+    Tách thành (sự kiện 'open', sự kiện 'close'). Sự kiện 'open' cần áp dụng trước khi phân tích giao dịch
+    để lệnh chuyển vào tài khoản mới được nhận diện; sự kiện 'close' áp dụng sau khi đã in, để lệnh chuyển
+    ra khỏi tài khoản ngay trước closeAccount vẫn được báo cáo.
+    """
+    opened = {account: event for account, event in events.items() if event[0] == 'open'}
+    closed = {account: event for account, event in events.items() if event[0] == 'close'}
+    return opened, closed
+
+
+async def _apply_account_lifecycle_events(
+    events: dict[str, tuple[str, str]], context: dict, main_wallet_str: str, owned_accounts_strs: set[str], http_client: AsyncClient
+):
+    """Thêm hoặc gỡ các tài khoản token của ví chính khỏi danh sách giám sát mà không cần quét lại."""
+    for account_str, (kind, owner) in events.items():
+        if owner != main_wallet_str or account_str == main_wallet_str:
+            continue
+
+        if kind == 'open' and account_str not in owned_accounts_strs:
+            owned_accounts_strs.add(account_str)
+            print(f"  [Giám sát] Phát hiện tài khoản token mới: {account_str}. Bắt đầu giám sát.")
+            task = asyncio.create_task(_monitor_single_account(
+                Pubkey.from_string(account_str), http_client, context, main_wallet_str, owned_accounts_strs
+            ))
+            context['monitor_tasks'][account_str] = task
+
+        elif kind == 'close' and account_str in owned_accounts_strs:
+            owned_accounts_strs.discard(account_str)
+            print(f"  [Giám sát] Tài khoản token {account_str} đã bị đóng. Dừng giám sát.")
+            task = context['monitor_tasks'].pop(account_str, None)
+            # Tác vụ đang xử lý chính thông báo này sẽ tự thoát sau khi xử lý xong.
+            if task is not None and task is not asyncio.current_task():
+                task.cancel()
+
+
 async def _process_log_notification(
-    notification, context: dict, main_wallet_str: str, owned_accounts_strs: set[str], http_client: AsyncClient
+    notification, context: dict, main_wallet_str: str, owned_accounts_strs: set[str], http_client: AsyncClient,
+    notified_at: float | None = None
 ):
     """Xử lý một thông báo log, đảm bảo không xử lý trùng lặp."""
     if not (hasattr(notification, 'result') and notification.result and hasattr(notification.result, 'value')):
@@ -266,21 +500,103 @@ async def _process_log_notification(
         context['processed_signatures'].add(signature)
     
     # --- Bắt đầu xử lý. Không còn giữ khóa ở đây. ---
-    now = datetime.now(timezone.utc)
-    print(f"\nGiao dịch được xử lý (Signature: {signature}) lúc {now.strftime('%Y-%m-%d %H:%M:%S %Z')}")
-    print(f"   Xem trên Solana Explorer: https://explorer.solana.com/tx/{signature}?cluster=devnet")
-        
+    notified_slot = getattr(getattr(notification.result, 'context', None), 'slot', None)
+    context['tracer'].start(signature, notified_at or time.time(), notified_slot)
+    await _process_signature(signature, 0, context, main_wallet_str, owned_accounts_strs, http_client)
+
+
+def _schedule_retry(context: dict, signature, attempt: int):
+    """Đưa một signature vào hàng đợi thử lại với thời gian chờ tăng dần."""
+    due = asyncio.get_running_loop().time() + RETRY_DELAYS_SECONDS[attempt - 1]
+    heapq.heappush(context['retry_queue'], (due, next(context['retry_seq']), attempt, signature))
+    context['retry_wakeup'].set()
+
+
+async def _retry_worker(context: dict, main_wallet_str: str, owned_accounts_strs: set[str], http_client: AsyncClient):
+    """Xử lý lại các signature trong hàng đợi thử lại khi đến hạn."""
+    queue, wakeup = context['retry_queue'], context['retry_wakeup']
+    loop = asyncio.get_running_loop()
+    while True:
+        wakeup.clear()
+        if not queue:
+            await wakeup.wait()
+            continue
+        due, _, attempt, signature = queue[0]
+        delay = due - loop.time()
+        if delay > 0:
+            try:
+                await asyncio.wait_for(wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            continue
+        heapq.heappop(queue)
+        await _process_signature(signature, attempt, context, main_wallet_str, owned_accounts_strs, http_client)
+
+
+async def _finalization_worker(context: dict, http_client: AsyncClient):
+    """Thông báo lại các giao dịch đã hiển thị ở mức 'confirmed' khi chúng được finalized."""
+    awaiting = context['awaiting_finalization']
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(FINALIZATION_POLL_SECONDS)
+        signatures = list(awaiting)
+        for i in range(0, len(signatures), MAX_SIGNATURES_PER_STATUS_REQUEST):
+            chunk = signatures[i:i + MAX_SIGNATURES_PER_STATUS_REQUEST]
+            try:
+                statuses = (await http_client.get_signature_statuses(chunk, search_transaction_history=True)).value
+            except Exception as e:
+                print(f"  [Finalized] Không thể lấy trạng thái giao dịch: {e}")
+                continue
+            for signature, status in zip(chunk, statuses):
+                if status is not None and status.confirmation_status == TransactionConfirmationStatus.Finalized:
+                    awaiting.pop(signature, None)
+                    print(f"\n[Finalized] Giao dịch {signature} đã được finalized (slot {status.slot}).")
+                elif loop.time() - awaiting[signature] > FINALIZATION_TIMEOUT_SECONDS:
+                    awaiting.pop(signature, None)
+                    print(f"\n[Finalized] Giao dịch {signature} chưa được finalized sau {FINALIZATION_TIMEOUT_SECONDS}s; có thể đã bị loại khỏi fork.")
+
+
+async def _process_signature(
+    signature, attempt: int, context: dict, main_wallet_str: str, owned_accounts_strs: set[str], http_client: AsyncClient
+):
+    """Lấy và in chi tiết một giao dịch ở mức 'confirmed'; nếu chưa truy vấn được thì đưa vào hàng đợi thử lại."""
+    tracer = context['tracer']
+    tracer.begin_fetch(signature)
     try:
         tx_response = await http_client.get_transaction(
             signature,
             encoding="jsonParsed",
-            max_supported_transaction_version=0
+            max_supported_transaction_version=0,
+            commitment=Confirmed,
         )
-        if not tx_response.value:
-            print("  Không thể lấy chi tiết giao dịch.")
-            # finally sẽ được gọi để in dòng phân cách
-            return
-            
+        fetch_error = None
+    except Exception as e:
+        tx_response, fetch_error = None, e
+    tracer.end_fetch(signature)
+
+    if not (tx_response and tx_response.value):
+        if attempt < len(RETRY_DELAYS_SECONDS):
+            _schedule_retry(context, signature, attempt + 1)
+        else:
+            reason = f": {fetch_error}" if fetch_error else ""
+            tracer.discard(signature)
+            print(f"\n[Lỗi] Không thể lấy chi tiết giao dịch {signature} sau {attempt + 1} lần thử{reason}")
+            print(f"   Xem trên Solana Explorer: https://explorer.solana.com/tx/{signature}?cluster=devnet")
+        return
+
+    now = datetime.now(timezone.utc)
+    retry_note = f" (sau {attempt} lần thử lại)" if attempt else ""
+    print(f"\nGiao dịch được xử lý (Signature: {signature}) lúc {now.strftime('%Y-%m-%d %H:%M:%S %Z')}{retry_note}")
+    print(f"   Xem trên Solana Explorer: https://explorer.solana.com/tx/{signature}?cluster=devnet")
+
+    if context.get('emit_finalized'):
+        context['awaiting_finalization'][signature] = asyncio.get_running_loop().time()
+
+    if tx_response.value.block_time:
+        tracer.mark(signature, 'block_time', float(tx_response.value.block_time))
+
+    closed_events = {}
+    try:
         tx_data = tx_response.value
         
         # Trích xuất chính xác đối tượng 'meta' từ trong trường 'transaction'
@@ -288,6 +604,12 @@ async def _process_log_notification(
         meta = getattr(transaction_detail, 'meta', None)
         message = getattr(transaction_detail.transaction, 'message', None)
 
+        # Thêm tài khoản mới trước khi phân tích, để giao dịch tạo ATA mới được nhận diện ngay;
+        # tài khoản bị đóng chỉ được gỡ sau khi đã in xong giao dịch.
+        opened_events, closed_events = _split_account_lifecycle_events(_extract_account_lifecycle_events(message, meta))
+        if opened_events:
+            await _apply_account_lifecycle_events(opened_events, context, main_wallet_str, owned_accounts_strs, http_client)
+
         # --- Hiển thị Chi tiết Giao dịch Phong phú ---
         if tx_data.block_time:
             dt_object = datetime.fromtimestamp(tx_data.block_time, timezone.utc)
@@ -303,26 +625,10 @@ async def _process_log_notification(
             print(f"  Người trả phí: {fee_payer}")
 
         print("\n  --- Phân tích chỉ thị ---")
-        total_relevant_instructions = 0
-
-        # Phân tích các chỉ thị cấp cao nhất
-        if message and hasattr(message, 'instructions') and message.instructions:
-            for idx, instruction in enumerate(message.instructions):
-                has_inner = meta and any(ix_set.index == idx for ix_set in meta.inner_instructions or [])
-                if not has_inner:
-                    was_relevant = await _parse_and_print_instruction(instruction, main_wallet_str, owned_accounts_strs, http_client, "  -> ")
-                    if was_relevant:
-                        total_relevant_instructions += 1
-
-        # Phân tích các chỉ thị bên trong
-        if meta and hasattr(meta, 'inner_instructions') and meta.inner_instructions:
-            for inner_instruction_set in meta.inner_instructions:
-                print(f"  - Chỉ thị từ Program Call #{inner_instruction_set.index + 1}:")
-                for sub_idx, instruction in enumerate(inner_instruction_set.instructions):
-                     was_relevant = await _parse_and_print_instruction(instruction, main_wallet_str, owned_accounts_strs, http_client, f"    {sub_idx+1}. ")
-                     if was_relevant:
-                        total_relevant_instructions += 1
-        
+        total_relevant_instructions = await _print_relevant_instructions(
+            message, meta, main_wallet_str, owned_accounts_strs, http_client
+        )
+
         if total_relevant_instructions == 0:
             print("  Giao dịch này có đề cập đến một trong các tài khoản của bạn, nhưng không phải trong một giao dịch chuyển trực tiếp.")
 
@@ -335,6 +641,10 @@ async def _process_log_notification(
                 if acc_str in owned_accounts_strs:
                     accounts_involved.add(acc.pubkey)
         
+        if accounts_involved and context.get('cache') is not None:
+            # Giữ trạng thái cho chế độ gửi nhanh luôn mới: nạp lại đúng các tài khoản vừa thay đổi.
+            context['cache'].refresh_in_background(list(accounts_involved))
+
         if accounts_involved:
             for acc_pubkey in sorted(list(accounts_involved), key=str):
                 acc_str = str(acc_pubkey)
@@ -362,9 +672,12 @@ async def _process_log_notification(
     except Exception as e:
         print(f"  Lỗi khi xử lý chi tiết giao dịch: {e}")
     finally:
+        if closed_events:
+            await _apply_account_lifecycle_events(closed_events, context, main_wallet_str, owned_accounts_strs, http_client)
         # Signature đã được thêm vào. Chỉ cần in dòng kết thúc.
         print("====================================================================")
-        print("Nhấn 'ENTER' để dừng giám sát và quay lại menu")
+        print("Nhấn 'ENTER' để dừng giám sát và quay lại menu, hoặc nhập 's' rồi ENTER để xem thống kê độ trễ")
+        tracer.finish(signature, tx_response.value.slot)
 
 
 async def _monitor_single_account(pubkey: Pubkey, http_client: AsyncClient, context: dict, main_wallet_str: str, owned_accounts_strs: set[str]):
@@ -372,7 +685,7 @@ async def _monitor_single_account(pubkey: Pubkey, http_client: AsyncClient, cont
     print(f"  -> Bắt đầu giám sát cho: {pubkey}")
     try:
         async with connect("wss://api.devnet.solana.com") as websocket:
-            await websocket.logs_subscribe(RpcTransactionLogsFilterMentions(pubkey))
+            await websocket.logs_subscribe(RpcTransactionLogsFilterMentions(pubkey), commitment=Confirmed)
             first_resp = await websocket.recv()
             if not (first_resp and isinstance(first_resp, list) and len(first_resp) > 0 and hasattr(first_resp[0], 'result')):
                 print(f"Không thể xác nhận đăng ký cho {pubkey}. Đang thoát tác vụ.")
@@ -380,25 +693,46 @@ async def _monitor_single_account(pubkey: Pubkey, http_client: AsyncClient, cont
 
             async for messages in websocket:
                 if messages and isinstance(messages, list):
+                    # Mốc thời gian thông báo tới, dùng cho thống kê độ trễ.
+                    notified_at = time.time()
                     for msg_item in messages:
                         # Truyền toàn bộ ngữ cảnh cho trình phân tích
-                        await _process_log_notification(msg_item, context, main_wallet_str, owned_accounts_strs, http_client)
+                        await _process_log_notification(msg_item, context, main_wallet_str, owned_accounts_strs, http_client, notified_at)
+                    # Tài khoản đã bị đóng trong lúc xử lý: đóng kết nối này.
+                    if str(pubkey) not in owned_accounts_strs:
+                        return
     except Exception as e:
         print(f"Lỗi giám sát cho {pubkey}: {e}. Tác vụ đang đóng.")
 
 
-async def live_monitor(client: AsyncClient, main_wallet_pubkey: Pubkey):
+async def live_monitor(client: AsyncClient, main_wallet_pubkey: Pubkey, emit_finalized: bool = False, cache=None):
     """
     Chức năng chính để giám sát tất cả các tài khoản liên quan đến một ví chính.
+    Giao dịch được xử lý ở mức 'confirmed' để giảm độ trễ; nếu `emit_finalized` bật,
+    mỗi giao dịch được thông báo lại khi đã finalized. Nếu có `cache` (WalletCache), trạng thái
+    các tài khoản bị giao dịch thay đổi được nạp lại để chế độ gửi nhanh luôn dùng dữ liệu mới.
     Phiên bản này cho phép dừng bằng cách nhấn Enter.
     """
     main_wallet_str = str(main_wallet_pubkey)
-    tasks = []
     # --- Tạo một ngữ cảnh chia sẻ cho tất cả các tác vụ giám sát để tránh xử lý trùng lặp ---
     context = {
         "processed_signatures": set(),
-        "lock": asyncio.Lock()
+        "lock": asyncio.Lock(),
+        # Tài khoản -> tác vụ giám sát; được cập nhật khi phát hiện tài khoản token mới hoặc bị đóng.
+        "monitor_tasks": {},
+        # Hàng đợi thử lại (heap theo thời điểm đến hạn) cho các giao dịch chưa truy vấn được.
+        "retry_queue": [],
+        "retry_seq": itertools.count(),
+        "retry_wakeup": asyncio.Event(),
+        "emit_finalized": emit_finalized,
+        # Signature -> thời điểm hiển thị ở mức 'confirmed', chờ được finalized.
+        "awaiting_finalization": {},
+        "cache": cache,
+        "tracer": LatencyTracer(),
     }
+    tasks = []
+    background_tasks = []
+    input_task = None
 
     try:
         # --- Tìm tất cả các tài khoản để giám sát ---
@@ -422,37 +756,59 @@ async def live_monitor(client: AsyncClient, main_wallet_pubkey: Pubkey):
         # --- Tạo và chạy một tác vụ giám sát cho mỗi tài khoản ---
         for pubkey in accounts_to_monitor:
             task = asyncio.create_task(_monitor_single_account(pubkey, client, context, main_wallet_str, owned_accounts_strs))
+            context['monitor_tasks'][str(pubkey)] = task
             tasks.append(task)
 
         if not tasks:
             print("Không có tài khoản nào để giám sát. Đang thoát.")
             return
+
+        background_tasks.append(asyncio.create_task(_retry_worker(context, main_wallet_str, owned_accounts_strs, client)))
+        if emit_finalized:
+            background_tasks.append(asyncio.create_task(_finalization_worker(context, client)))
+        background_tasks.append(asyncio.create_task(context['tracer'].log_periodically()))
             
         print("\nTất cả các trình giám sát đã bắt đầu. Đang lắng nghe tất cả các giao dịch...")
         print("====================================================================")
-        print("Nhấn 'ENTER' để dừng giám sát và quay lại menu")
+        print("Nhấn 'ENTER' để dừng giám sát và quay lại menu, hoặc nhập 's' rồi ENTER để xem thống kê độ trễ")
+
+        # Tạo một tác vụ để lắng nghe input từ người dùng mà không chặn vòng lặp sự kiện asyncio
+        input_task = asyncio.create_task(ainput())
+
+        # Chờ tác vụ input hoặc một trong các tác vụ giám sát hoàn thành.
+        # Danh sách tác vụ được đọc lại mỗi vòng vì tài khoản có thể được thêm/gỡ khi đang chạy.
+        while True:
+            active_tasks = list(context['monitor_tasks'].values())
+            done, pending = await asyncio.wait(
+                active_tasks + [input_task],
+                return_when=asyncio.FIRST_COMPLETED
+            )
 
-        # Tạo một tác vụ để lắng nghe input từ người dùng trong một thread riêng
-        # để không chặn vòng lặp sự kiện asyncio
-        input_task = asyncio.create_task(asyncio.to_thread(input))
+            # Nếu tác vụ input hoàn thành: 's' để xem thống kê độ trễ, Enter để dừng
+            if input_task in done:
+                if input_task.result().strip().lower() == 's':
+                    print(f"\n{context['tracer'].report()}")
+                    input_task = asyncio.create_task(ainput())
+                    continue
+                print("\nĐang dừng giám sát theo yêu cầu của người dùng...")
+                break
 
-        # Chờ tác vụ input hoặc một trong các tác vụ giám sát hoàn thành
-        done, pending = await asyncio.wait(
-            tasks + [input_task], 
-            return_when=asyncio.FIRST_COMPLETED
-        )
+            # Tác vụ của tài khoản đã bị đóng kết thúc bình thường; tiếp tục chờ.
+            failed_tasks = [task for task in done if task in context['monitor_tasks'].values()]
+            if not failed_tasks:
+                continue
 
-        # Nếu tác vụ input hoàn thành, có nghĩa là người dùng đã nhấn Enter
-        if input_task in done:
-            print("\nĐang dừng giám sát theo yêu cầu của người dùng...")
-        else:
             # Nếu một tác vụ giám sát bị lỗi, in ra lỗi
-            for task in done:
-                if task.exception():
+            for task in failed_tasks:
+                if not task.cancelled() and task.exception():
                     print(f"\nMột tác vụ giám sát đã kết thúc với lỗi: {task.exception()}")
+            break
 
     finally:
-        # Hủy tất cả các tác vụ đang chờ (bao gồm cả các tác vụ giám sát)
+        # Hủy tất cả các tác vụ đang chờ (bao gồm cả các tác vụ giám sát được thêm khi đang chạy)
+        tasks = list(set(tasks) | set(context['monitor_tasks'].values())) + background_tasks
+        if input_task is not None:
+            tasks.append(input_task)
         for task in tasks: # tasks list is correct here, 'pending' might not contain all of them
             if not task.done():
                 task.cancel()
@@ -461,4 +817,64 @@ async def live_monitor(client: AsyncClient, main_wallet_pubkey: Pubkey):
         if tasks:
             await asyncio.gather(*tasks, return_exceptions=True)
             
-        print("\nĐã dừng tất cả các tác vụ giám sát. Quay lại menu chính.") 
\ No newline at end of file
+        print("\nĐã dừng tất cả các tác vụ giám sát. Quay lại menu chính.") 
+
+
+# ==============================================================================
+# --- 4. Chức năng Quét khối song song ---
+# ==============================================================================
+async def _fetch_block_matches(client: AsyncClient, slot: int, watched: set[Pubkey], semaphore: asyncio.Semaphore):
+    """Lấy một khối và trả về (block_time, [giao dịch liên quan]) hoặc None nếu không lấy được."""
+    async with semaphore:
+        try:
+            block_resp = await client.get_block(slot, encoding="jsonParsed", max_supported_transaction_version=0)
+        except Exception:
+            return None
+    block = block_resp.value
+    if block is None:
+        return None
+
+    matches = []
+    for transaction_detail in block.transactions or []:
+        message = transaction_detail.transaction.message
+        if any(acc.pubkey in watched for acc in message.account_keys):
+            matches.append(transaction_detail)
+    return block.block_time, matches
+
+
+async def scan_block_range(
+    client: AsyncClient, watched: set[Pubkey], start_slot: int, end_slot: int,
+    max_concurrency: int = DEFAULT_SCAN_CONCURRENCY
+) -> int:
+    """
+    Dựng lại hoạt động của các tài khoản trong `watched` cho một khoảng slot bằng cách lấy
+    các khối đồng thời thay vì phân trang getSignaturesForAddress. Trả về số giao dịch tìm thấy.
+    """
+    print(f"\nĐang quét các khối từ slot {start_slot} đến {end_slot} cho {len(watched)} tài khoản...")
+    blocks_resp = await client.get_blocks(start_slot, end_slot)
+    slots = blocks_resp.value or []
+    if not slots:
+        print("Không có khối nào trong khoảng slot này.")
+        return 0
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+    results = await asyncio.gather(*(_fetch_block_matches(client, slot, watched, semaphore) for slot in slots))
+
+    total_matches = 0
+    missing_slots = 0
+    for slot, result in zip(slots, results):
+        if result is None:
+            missing_slots += 1
+            continue
+        block_time, matches = result
+        for transaction_detail in matches:
+            total_matches += 1
+            print(f"\n[Slot {slot}] Giao dịch: {transaction_detail.transaction.signatures[0]}")
+            print("-" * 50)
+            _print_transaction_summary(transaction_detail, block_time)
+            print("-" * 50)
+
+    print(f"\nĐã quét {len(slots) - missing_slots}/{len(slots)} khối, tìm thấy {total_matches} giao dịch liên quan.")
+    if missing_slots:
+        print(f"Cảnh báo: Không thể lấy {missing_slots} khối.")
+    return total_matches
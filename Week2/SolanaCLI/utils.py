@@ -1,3 +1,7 @@
+import asyncio
+import sys
+import threading
+
 from solders.keypair import Keypair
 
 def print_header(title: str):
@@ -7,6 +11,43 @@ def print_header(title: str):
     print(f"--- {title} ---")
     print(f"{bar}")
 
+# (vòng lặp sự kiện, hàng đợi các dòng đọc từ stdin) của thread đọc stdin đang chạy
+_stdin_reader: tuple[asyncio.AbstractEventLoop, asyncio.Queue] | None = None
+
+def _read_stdin_lines(loop: asyncio.AbstractEventLoop, lines: asyncio.Queue):
+    """Chạy trong một daemon thread: chuyển từng dòng của stdin vào hàng đợi của vòng lặp sự kiện."""
+    while True:
+        line = sys.stdin.readline()
+        try:
+            loop.call_soon_threadsafe(lines.put_nowait, line)
+        except RuntimeError:
+            # Vòng lặp sự kiện đã đóng.
+            return
+        if not line:
+            return
+
+async def ainput(prompt: str = "") -> str:
+    """
+    Phiên bản bất đồng bộ của input(): vòng lặp sự kiện vẫn chạy được các tác vụ nền trong lúc chờ.
+    Stdin được đọc bởi một daemon thread duy nhất, nên Ctrl+C vẫn thoát chương trình ngay
+    (asyncio.run không phải chờ một thread đang bị chặn trong input()), và hủy một lần chờ
+    không làm mất dòng mà người dùng nhập sau đó.
+    """
+    global _stdin_reader
+    loop = asyncio.get_running_loop()
+    if _stdin_reader is None or _stdin_reader[0] is not loop:
+        _stdin_reader = (loop, asyncio.Queue())
+        threading.Thread(target=_read_stdin_lines, args=_stdin_reader, daemon=True).start()
+
+    print(prompt, end="", flush=True)
+    lines = _stdin_reader[1]
+    line = await lines.get()
+    if not line:
+        # Hết stdin: giữ lại dấu hiệu EOF cho các lần gọi sau, giống input().
+        lines.put_nowait(line)
+        raise EOFError
+    return line.rstrip("\n")
+
 def login_with_secret_key() -> Keypair | None:
     """
     Yêu cầu người dùng nhập secret key dưới dạng một chuỗi byte
@@ -0,0 +1,322 @@
+import asyncio
+import time
+from decimal import Decimal
+
+from solana.rpc.async_api import AsyncClient
+from solana.rpc.commitment import Confirmed
+from solana.rpc.types import TokenAccountOpts
+from solders.pubkey import Pubkey
+from solders.transaction_status import TransactionConfirmationStatus
+from spl.token._layouts import ACCOUNT_LAYOUT, MINT_LAYOUT
+from spl.token.constants import TOKEN_PROGRAM_ID
+
+# Số signature gần nhất được tải trước cho ví chính.
+SIGNATURE_PAGE_SIZE = 20
+# Danh sách tài khoản token và trang signature cũ hơn mức này được nạp lại, để giao dịch đến vẫn hiện ra.
+WALLET_DATA_MAX_AGE_SECONDS = 15
+# Blockhash còn hiệu lực khoảng 60-90 giây; làm mới sớm hơn nhiều để an toàn.
+BLOCKHASH_MAX_AGE_SECONDS = 20
+# Khoảng chờ (khoảng một slot) trước khi hỏi lại khi RPC vẫn trả về blockhash vừa dùng.
+BLOCKHASH_RETRY_SECONDS = 0.4
+# getMultipleAccounts nhận tối đa 100 địa chỉ mỗi lần gọi.
+MAX_ACCOUNTS_PER_REQUEST = 100
+# Trạng thái tài khoản cũ hơn mức này không được dùng để kiểm tra nhanh trước khi gửi.
+ACCOUNT_STATE_MAX_AGE_SECONDS = 30
+# Sau khi gửi giao dịch, kiểm tra trạng thái với chu kỳ này cho tới khi giao dịch đạt mức 'confirmed'.
+CONFIRMATION_POLL_SECONDS = 1
+# Blockhash hết hạn sau khoảng 60-90 giây; quá mức này giao dịch chắc chắn không còn được xác nhận.
+CONFIRMATION_TIMEOUT_SECONDS = 90
+TOKEN_ACCOUNT_SIZE = 165
+
+
+def format_ui_amount(amount: int, decimals: int) -> str:
+    """Định dạng số lượng nguyên tử thành chuỗi giống `ui_amount_string` của RPC (ví dụ 867.167)."""
+    value = Decimal(amount).scaleb(-decimals)
+    return format(value.normalize(), 'f') if value else "0"
+
+
+class WalletCache:
+    """
+    Bộ nhớ đệm cho ví đã đăng nhập: danh sách tài khoản token kèm số dư, trang signature gần nhất,
+    số thập phân của các mint và một blockhash mới. Sau khi đăng nhập, `start_prefetch()` nạp
+    tất cả ở chế độ nền để các chức năng trong menu phản hồi ngay.
+    """
+
+    def __init__(self, client: AsyncClient, owner: Pubkey):
+        self.client = client
+        self.owner = owner
+        # Mỗi phần tử: (pubkey tài khoản token, địa chỉ mint dạng chuỗi hoặc None, số dư dạng chuỗi hoặc None)
+        self.token_accounts: list[tuple[Pubkey, str | None, str | None]] | None = None
+        self.signatures: list | None = None
+        self._token_accounts_fetched_at = 0.0
+        self._signatures_fetched_at = 0.0
+        self.mint_decimals: dict[Pubkey, int] = {}
+        self._blockhash = None
+        self._blockhash_fetched_at = 0.0
+        # Blockhash của giao dịch vừa gửi; không dùng lại để hai giao dịch giống nhau không trùng signature.
+        self._spent_blockhash = None
+        # Tài khoản -> (tồn tại?, lamports, số lượng token thô hoặc None, thời điểm nạp)
+        self.account_states: dict[Pubkey, tuple[bool, int, int | None, float]] = {}
+        # Tài khoản -> các signature vừa gửi chưa được xác nhận; trạng thái của tài khoản bị coi là cũ
+        self._pending_sends: dict[Pubkey, set] = {}
+        # Tài khoản -> thời điểm xác nhận giao dịch gần nhất; lần nạp trước mốc này là đã cũ
+        self._settles_at: dict[Pubkey, float] = {}
+        self.rent_exemptions: dict[int, int] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._refresh_tasks: set[asyncio.Task] = set()
+
+    # --- Điều phối tác vụ nền ---
+    def _run_once(self, name: str, coro_factory) -> asyncio.Task:
+        """Chạy một lần nạp dữ liệu; nếu lần nạp cùng tên đang chạy thì dùng chung tác vụ đó."""
+        task = self._tasks.get(name)
+        if task is None or task.done():
+            task = asyncio.create_task(coro_factory())
+            # Lỗi của tác vụ nền được báo lại cho nơi chờ kết quả; tránh cảnh báo "exception was never retrieved".
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._tasks[name] = task
+        return task
+
+    def _reload(self, name: str, coro_factory) -> asyncio.Task:
+        """
+        Nạp lại từ đầu. Lần nạp đang chạy (có thể đã lỗi thời) không bị hủy vì có thể đang có nơi chờ nó;
+        lần nạp mới bắt đầu ngay sau khi nó kết thúc, và những nơi gọi sau đó sẽ chờ lần nạp mới.
+        """
+        previous = self._tasks.get(name)
+
+        async def reload():
+            if previous is not None and not previous.done():
+                await asyncio.wait([previous])
+            await coro_factory()
+
+        task = asyncio.create_task(reload())
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._tasks[name] = task
+        return task
+
+    async def _await_loading(self, name: str) -> bool:
+        """Chờ lần nạp `name` đang chạy (nếu có). Trả về True nếu đã phải chờ."""
+        task = self._tasks.get(name)
+        if task is None or task.done():
+            return False
+        await task
+        return True
+
+    def start_prefetch(self):
+        """Bắt đầu nạp nền mọi dữ liệu mà menu cần. Không chờ kết quả."""
+        self._run_once("token_accounts", self._load_token_accounts)
+        self._run_once("signatures", self._load_signatures)
+        self._run_once("blockhash", self._load_blockhash)
+        self._run_once("rent", self._load_rent_exemptions)
+
+    def invalidate(self, signature, touched_accounts: list[Pubkey], blockhash=None):
+        """
+        Gọi sau khi gửi giao dịch `signature`: trạng thái của `touched_accounts` bị coi là cũ cho tới khi
+        giao dịch được xác nhận; khi đó số dư, lịch sử và các tài khoản này được nạp lại ở chế độ nền.
+        `blockhash` là blockhash giao dịch đã dùng: giao dịch sau sẽ nhận một blockhash khác.
+        """
+        if blockhash is not None:
+            self._spent_blockhash = blockhash
+            self._blockhash = None
+            self._reload("blockhash", self._load_blockhash)
+        for pubkey in touched_accounts:
+            self._pending_sends.setdefault(pubkey, set()).add(signature)
+        task = asyncio.create_task(self._reload_after_confirmation(signature, touched_accounts))
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def _wait_for_confirmation(self, signature):
+        """Chờ tới khi `signature` đạt mức 'confirmed' (thành công hay thất bại), hoặc hết thời gian chờ."""
+        deadline = time.monotonic() + CONFIRMATION_TIMEOUT_SECONDS
+        while time.monotonic() < deadline:
+            await asyncio.sleep(CONFIRMATION_POLL_SECONDS)
+            try:
+                status = (await self.client.get_signature_statuses([signature])).value[0]
+            except Exception:
+                continue
+            if status is not None and status.confirmation_status in (
+                TransactionConfirmationStatus.Confirmed, TransactionConfirmationStatus.Finalized
+            ):
+                return
+
+    async def _reload_after_confirmation(self, signature, touched_accounts: list[Pubkey]):
+        try:
+            await self._wait_for_confirmation(signature)
+        finally:
+            # Kể cả khi hết thời gian chờ: giao dịch đã hết hạn nên mọi lần nạp từ giờ đều phản ánh đúng trạng thái.
+            settled_at = time.monotonic()
+            for pubkey in touched_accounts:
+                pending = self._pending_sends.get(pubkey)
+                if pending is not None:
+                    pending.discard(signature)
+                    if not pending:
+                        del self._pending_sends[pubkey]
+                self._settles_at[pubkey] = settled_at
+        self.token_accounts = None
+        self.signatures = None
+        self._reload("token_accounts", self._load_token_accounts)
+        self._reload("signatures", self._load_signatures)
+        await self.refresh_account_states(touched_accounts)
+
+    async def close(self):
+        tasks = list(self._tasks.values()) + list(self._refresh_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    # --- Tài khoản token và số dư ---
+    async def _load_mint_decimals(self, mints: list[Pubkey]):
+        missing = [m for m in mints if m not in self.mint_decimals]
+        for i in range(0, len(missing), MAX_ACCOUNTS_PER_REQUEST):
+            chunk = missing[i:i + MAX_ACCOUNTS_PER_REQUEST]
+            resp = await self.client.get_multiple_accounts(chunk)
+            for mint, account in zip(chunk, resp.value):
+                if account is not None:
+                    self.mint_decimals[mint] = MINT_LAYOUT.parse(account.data).decimals
+
+    async def _load_token_accounts(self):
+        fetched_at = time.monotonic()
+        # Lấy dữ liệu thô để tránh lỗi parse JSON của thư viện
+        resp = await self.client.get_token_accounts_by_owner(
+            self.owner, TokenAccountOpts(program_id=TOKEN_PROGRAM_ID), commitment=Confirmed
+        )
+        parsed = []
+        for acc_info in resp.value or []:
+            try:
+                account_data = ACCOUNT_LAYOUT.parse(acc_info.account.data)
+                parsed.append((acc_info.pubkey, Pubkey(account_data.mint), account_data.amount))
+            except Exception:
+                parsed.append((acc_info.pubkey, None, None))
+
+        # Một lần getMultipleAccounts cho mọi mint thay vì một lần getTokenAccountBalance cho mỗi tài khoản.
+        await self._load_mint_decimals(list({mint for _, mint, _ in parsed if mint is not None}))
+
+        for acc_info, (pubkey, _, amount) in zip(resp.value or [], parsed):
+            self.account_states[pubkey] = (True, acc_info.account.lamports, amount, fetched_at)
+        await self.refresh_account_states([self.owner])
+
+        token_accounts = []
+        for pubkey, mint, amount in parsed:
+            if mint is None or mint not in self.mint_decimals:
+                token_accounts.append((pubkey, str(mint) if mint else None, None))
+            else:
+                token_accounts.append((pubkey, str(mint), format_ui_amount(amount, self.mint_decimals[mint])))
+        self.token_accounts = token_accounts
+        self._token_accounts_fetched_at = fetched_at
+
+    async def get_token_accounts(self) -> list[tuple[Pubkey, str | None, str | None]]:
+        # Một lần nạp đang chạy (kể cả lần nạp lại sau khi gửi) luôn mới hơn dữ liệu hiện có.
+        if not await self._await_loading("token_accounts") and (
+            self.token_accounts is None or time.monotonic() - self._token_accounts_fetched_at > WALLET_DATA_MAX_AGE_SECONDS
+        ):
+            await self._run_once("token_accounts", self._load_token_accounts)
+        return self.token_accounts
+
+    async def get_ata_mints(self) -> dict[str, tuple[str, int]]:
+        """{tài khoản token: (mint, số thập phân)} cho các tài khoản token của ví."""
+        ata_mints = {}
+        for pubkey, mint_str, _ in await self.get_token_accounts():
+            if mint_str is None:
+                continue
+            decimals = self.mint_decimals.get(Pubkey.from_string(mint_str))
+            if decimals is not None:
+                ata_mints[str(pubkey)] = (mint_str, decimals)
+        return ata_mints
+
+    async def get_mint_decimals(self, mint: Pubkey) -> int:
+        if mint not in self.mint_decimals:
+            await self._load_mint_decimals([mint])
+        if mint not in self.mint_decimals:
+            raise ValueError("Không tìm thấy tài khoản mint")
+        return self.mint_decimals[mint]
+
+    # --- Trang signature gần nhất ---
+    async def _load_signatures(self):
+        resp = await self.client.get_signatures_for_address(self.owner, limit=SIGNATURE_PAGE_SIZE, commitment=Confirmed)
+        self.signatures = resp.value or []
+        self._signatures_fetched_at = time.monotonic()
+
+    async def get_signatures(self, address: Pubkey, limit: int) -> list | None:
+        """Trả về `limit` signature gần nhất từ bộ nhớ đệm, hoặc None nếu bộ nhớ đệm không đáp ứng được."""
+        if address != self.owner or limit > SIGNATURE_PAGE_SIZE:
+            return None
+        if not await self._await_loading("signatures") and (
+            self.signatures is None or time.monotonic() - self._signatures_fetched_at > WALLET_DATA_MAX_AGE_SECONDS
+        ):
+            await self._run_once("signatures", self._load_signatures)
+        return self.signatures[:limit]
+
+    # --- Blockhash ---
+    async def _load_blockhash(self):
+        resp = await self.client.get_latest_blockhash()
+        while resp.value.blockhash == self._spent_blockhash:
+            await asyncio.sleep(BLOCKHASH_RETRY_SECONDS)
+            resp = await self.client.get_latest_blockhash()
+        self._blockhash = resp.value
+        self._blockhash_fetched_at = time.monotonic()
+
+    async def get_latest_blockhash(self):
+        """Trả về `value` của getLatestBlockhash (blockhash và last_valid_block_height), làm mới khi đã cũ."""
+        if self._blockhash is None or time.monotonic() - self._blockhash_fetched_at > BLOCKHASH_MAX_AGE_SECONDS:
+            await self._run_once("blockhash", self._load_blockhash)
+        elif self._blockhash.blockhash == self._spent_blockhash:
+            await self._reload("blockhash", self._load_blockhash)
+        return self._blockhash
+
+    # --- Trạng thái tài khoản cho kiểm tra nhanh trước khi gửi ---
+    async def refresh_account_states(self, pubkeys: list[Pubkey]):
+        """Nạp lại lamports và số dư token của nhiều tài khoản bằng các lệnh getMultipleAccounts theo lô."""
+        pubkeys = list(dict.fromkeys(pubkeys))
+        for i in range(0, len(pubkeys), MAX_ACCOUNTS_PER_REQUEST):
+            chunk = pubkeys[i:i + MAX_ACCOUNTS_PER_REQUEST]
+            # Lấy mốc trước khi gửi yêu cầu: phản hồi về sau khi giao dịch được xác nhận vẫn có thể là dữ liệu cũ.
+            fetched_at = time.monotonic()
+            resp = await self.client.get_multiple_accounts(chunk, commitment=Confirmed)
+            for pubkey, account in zip(chunk, resp.value):
+                if account is None:
+                    self.account_states[pubkey] = (False, 0, None, fetched_at)
+                    continue
+                token_amount = None
+                if account.owner == TOKEN_PROGRAM_ID and len(account.data) == TOKEN_ACCOUNT_SIZE:
+                    token_amount = ACCOUNT_LAYOUT.parse(account.data).amount
+                self.account_states[pubkey] = (True, account.lamports, token_amount, fetched_at)
+
+    def refresh_in_background(self, pubkeys: list[Pubkey]):
+        """Dùng cho trình giám sát: nạp lại các tài khoản vừa bị một giao dịch thay đổi mà không chặn luồng xử lý."""
+        task = asyncio.create_task(self.refresh_account_states(pubkeys))
+        self._refresh_tasks.add(task)
+        task.add_done_callback(self._refresh_tasks.discard)
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    def fresh_state(self, pubkey: Pubkey) -> tuple[bool, int, int | None] | None:
+        """Trả về (tồn tại?, lamports, số lượng token thô) nếu trạng thái đủ mới, ngược lại None."""
+        state = self.account_states.get(pubkey)
+        if state is None:
+            return None
+        exists, lamports, token_amount, fetched_at = state
+        if time.monotonic() - fetched_at > ACCOUNT_STATE_MAX_AGE_SECONDS:
+            return None
+        if pubkey in self._pending_sends:
+            return None
+        if fetched_at < self._settles_at.get(pubkey, 0.0):
+            return None
+        return exists, lamports, token_amount
+
+    async def get_account_state(self, pubkey: Pubkey) -> tuple[bool, int, int | None]:
+        """Như `fresh_state`, nhưng nạp lại tài khoản khi trạng thái đã cũ."""
+        state = self.fresh_state(pubkey)
+        if state is None:
+            await self.refresh_account_states([pubkey])
+            exists, lamports, token_amount, _ = self.account_states[pubkey]
+            state = (exists, lamports, token_amount)
+        return state
+
+    async def _load_rent_exemptions(self):
+        for size in (0, TOKEN_ACCOUNT_SIZE):
+            await self.get_rent_exemption(size)
+
+    async def get_rent_exemption(self, size: int) -> int:
+        if size not in self.rent_exemptions:
+            resp = await self.client.get_minimum_balance_for_rent_exemption(size)
+            self.rent_exemptions[size] = resp.value
+        return self.rent_exemptions[size]
@@ -0,0 +1,361 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+
+from solders.hash import Hash
+from solders.instruction import Instruction
+from solders.keypair import Keypair
+from solders.message import MessageV0, to_bytes_versioned
+from solders.pubkey import Pubkey
+from solders.signature import Signature
+from solders.system_program import create_account, CreateAccountParams
+from solders.transaction import VersionedTransaction
+from solana.rpc.async_api import AsyncClient
+from solana.rpc.types import TxOpts
+from spl.token.instructions import (
+    create_idempotent_associated_token_account,
+    get_associated_token_address,
+    initialize_mint,
+    InitializeMintParams,
+    mint_to,
+    MintToParams,
+    transfer,
+    TransferParams,
+)
+from spl.token.constants import TOKEN_PROGRAM_ID
+
+MINT_ACCOUNT_SIZE = 82
+# Maximum size of a serialized transaction (signatures + message).
+PACKET_DATA_SIZE = 1232
+# Keep transactions well below the size limit in signer-heavy batches (e.g. many new mints).
+MAX_SIGNERS_PER_TX = 8
+MAX_PARALLEL_SENDS = 8
+# A blockhash stays valid for ~60-90s; refresh well before that.
+BLOCKHASH_MAX_AGE_SECONDS = 30
+
+_rent_cache: dict[int, int] = {}
+
+
+async def get_rent_exemption(client: AsyncClient, size: int) -> int:
+    """Returns the rent-exempt minimum for an account of `size` bytes, fetching it once per size."""
+    if size not in _rent_cache:
+        resp = await client.get_minimum_balance_for_rent_exemption(size)
+        _rent_cache[size] = resp.value
+    return _rent_cache[size]
+
+
+# --- Declarative spec ---
+
+@dataclass
+class MintSpec:
+    """A new mint. The authority defaults to the payer."""
+    keypair: Keypair
+    decimals: int = 9
+    authority: Keypair | None = None
+
+
+@dataclass
+class AtaSpec:
+    """An associated token account to create for `owner`."""
+    owner: Pubkey
+    mint: Pubkey
+
+
+@dataclass
+class MintToSpec:
+    """Mints `amount` atomic units into the ATA of `owner`. The authority is resolved from the spec's mint when omitted."""
+    mint: Pubkey
+    owner: Pubkey
+    amount: int
+    authority: Keypair | None = None
+
+
+@dataclass
+class TransferSpec:
+    """Transfers `amount` atomic units between the ATAs of two owners."""
+    mint: Pubkey
+    source_owner: Keypair
+    dest_owner: Pubkey
+    amount: int
+
+
+@dataclass
+class ProvisioningSpec:
+    mints: list[MintSpec] = field(default_factory=list)
+    atas: list[AtaSpec] = field(default_factory=list)
+    mint_tos: list[MintToSpec] = field(default_factory=list)
+    transfers: list[TransferSpec] = field(default_factory=list)
+
+
+def build_fixture_spec(payer: Keypair, num_mints: int, holders: list[Pubkey], amount_ui: int, decimals: int = 9) -> ProvisioningSpec:
+    """Builds a test fixture: `num_mints` new mints, an ATA per holder per mint, and `amount_ui` tokens minted to each."""
+    spec = ProvisioningSpec()
+    for _ in range(num_mints):
+        mint = MintSpec(Keypair(), decimals=decimals, authority=payer)
+        spec.mints.append(mint)
+        for holder in holders:
+            spec.atas.append(AtaSpec(holder, mint.keypair.pubkey()))
+            spec.mint_tos.append(MintToSpec(mint.keypair.pubkey(), holder, amount_ui * 10**decimals))
+    return spec
+
+
+# --- Dependency graph and batching ---
+
+@dataclass
+class _Step:
+    key: tuple
+    instructions: list[Instruction]
+    signers: list[Keypair]
+    deps: set[tuple]
+    description: str
+
+
+@dataclass
+class _Batch:
+    wave: int
+    steps: list[_Step] = field(default_factory=list)
+    deps: set[int] = field(default_factory=set)
+
+    def instructions(self) -> list[Instruction]:
+        return [ix for step in self.steps for ix in step.instructions]
+
+    def signers(self, payer: Keypair) -> list[Keypair]:
+        unique = {payer.pubkey(): payer}
+        for step in self.steps:
+            for signer in step.signers:
+                unique.setdefault(signer.pubkey(), signer)
+        return list(unique.values())
+
+
+def _fits(payer: Keypair, steps: list[_Step]) -> bool:
+    """Checks whether `steps` can be sent as a single transaction."""
+    batch = _Batch(wave=0, steps=steps)
+    if len(batch.signers(payer)) > MAX_SIGNERS_PER_TX:
+        return False
+    try:
+        msg = MessageV0.try_compile(
+            payer=payer.pubkey(),
+            instructions=batch.instructions(),
+            address_lookup_table_accounts=[],
+            recent_blockhash=Hash.default(),
+        )
+    except Exception:
+        return False
+    # 1 byte for the signature count (shortvec, < 128 signers) + 64 bytes per signature
+    # + the message with its v0 version prefix, which bytes(msg) leaves out.
+    size = 1 + 64 * msg.header.num_required_signatures + len(to_bytes_versioned(msg))
+    return size <= PACKET_DATA_SIZE
+
+
+def _build_steps(payer: Keypair, spec: ProvisioningSpec, mint_rent: int) -> list[_Step]:
+    """Turns the spec into steps in a topological order, each step listing the keys it depends on."""
+    steps: list[_Step] = []
+    mint_authority: dict[Pubkey, Keypair] = {}
+    declared_atas: set[tuple] = set()
+    # ATA -> keys of the steps that fund it, so transfers out of it wait for them.
+    funding_steps: dict[Pubkey, list[tuple]] = {}
+
+    for mint in spec.mints:
+        mint_pubkey = mint.keypair.pubkey()
+        authority = mint.authority or payer
+        mint_authority[mint_pubkey] = authority
+        steps.append(_Step(
+            key=("mint", mint_pubkey),
+            instructions=[
+                create_account(CreateAccountParams(
+                    from_pubkey=payer.pubkey(),
+                    to_pubkey=mint_pubkey,
+                    lamports=mint_rent,
+                    space=MINT_ACCOUNT_SIZE,
+                    owner=TOKEN_PROGRAM_ID,
+                )),
+                initialize_mint(InitializeMintParams(
+                    program_id=TOKEN_PROGRAM_ID,
+                    mint=mint_pubkey,
+                    decimals=mint.decimals,
+                    mint_authority=authority.pubkey(),
+                    freeze_authority=None,
+                )),
+            ],
+            signers=[mint.keypair],
+            deps=set(),
+            description=f"create mint {mint_pubkey}",
+        ))
+
+    def mint_deps(mint_pubkey: Pubkey) -> set[tuple]:
+        return {("mint", mint_pubkey)} if mint_pubkey in mint_authority else set()
+
+    def ata_deps(owner: Pubkey, mint_pubkey: Pubkey) -> set[tuple]:
+        key = ("ata", owner, mint_pubkey)
+        return {key} if key in declared_atas else set()
+
+    for ata in spec.atas:
+        key = ("ata", ata.owner, ata.mint)
+        if key in declared_atas:
+            continue
+        declared_atas.add(key)
+        steps.append(_Step(
+            key=key,
+            # Idempotent: an ATA that already exists must not fail the other steps packed with it.
+            instructions=[create_idempotent_associated_token_account(payer=payer.pubkey(), owner=ata.owner, mint=ata.mint)],
+            signers=[],
+            deps=mint_deps(ata.mint),
+            description=f"create ATA of {ata.owner} for {ata.mint}",
+        ))
+
+    for i, spec_item in enumerate(spec.mint_tos):
+        authority = spec_item.authority or mint_authority.get(spec_item.mint)
+        if authority is None:
+            raise ValueError(f"No mint authority known for {spec_item.mint}")
+        dest = get_associated_token_address(spec_item.owner, spec_item.mint)
+        key = ("mint_to", i)
+        funding_steps.setdefault(dest, []).append(key)
+        steps.append(_Step(
+            key=key,
+            instructions=[mint_to(MintToParams(
+                program_id=TOKEN_PROGRAM_ID,
+                mint=spec_item.mint,
+                dest=dest,
+                mint_authority=authority.pubkey(),
+                amount=spec_item.amount,
+            ))],
+            signers=[authority],
+            deps=mint_deps(spec_item.mint) | ata_deps(spec_item.owner, spec_item.mint),
+            description=f"mint {spec_item.amount} of {spec_item.mint} to {dest}",
+        ))
+
+    for i, spec_item in enumerate(spec.transfers):
+        source_owner = spec_item.source_owner.pubkey()
+        source = get_associated_token_address(source_owner, spec_item.mint)
+        dest = get_associated_token_address(spec_item.dest_owner, spec_item.mint)
+        key = ("transfer", i)
+        deps = (ata_deps(source_owner, spec_item.mint)
+                | ata_deps(spec_item.dest_owner, spec_item.mint)
+                | set(funding_steps.get(source, [])))
+        funding_steps.setdefault(dest, []).append(key)
+        steps.append(_Step(
+            key=key,
+            instructions=[transfer(TransferParams(
+                program_id=TOKEN_PROGRAM_ID,
+                source=source,
+                dest=dest,
+                owner=source_owner,
+                amount=spec_item.amount,
+            ))],
+            signers=[spec_item.source_owner],
+            deps=deps,
+            description=f"transfer {spec_item.amount} of {spec_item.mint} from {source} to {dest}",
+        ))
+
+    return steps
+
+
+def plan_batches(payer: Keypair, steps: list[_Step]) -> list[_Batch]:
+    """
+    Packs steps into as few transactions as the size and signer limits allow.
+    A step joins the batch of its only dependency when it fits (instructions run in order
+    inside a transaction); otherwise it goes into the open batch of the first wave after
+    all of its dependencies.
+    """
+    batches: list[_Batch] = []
+    batch_of: dict[tuple, int] = {}
+    open_batch_of_wave: dict[int, int] = {}
+
+    def place(step: _Step, batch_idx: int):
+        batches[batch_idx].steps.append(step)
+        batch_of[step.key] = batch_idx
+
+    for step in steps:
+        dep_batches = {batch_of[d] for d in step.deps}
+
+        if len(dep_batches) == 1:
+            only = next(iter(dep_batches))
+            if _fits(payer, batches[only].steps + [step]):
+                place(step, only)
+                continue
+
+        wave = 1 + max((batches[b].wave for b in dep_batches), default=-1)
+        open_idx = open_batch_of_wave.get(wave)
+        if open_idx is None or not _fits(payer, batches[open_idx].steps + [step]):
+            batches.append(_Batch(wave=wave))
+            open_idx = len(batches) - 1
+            open_batch_of_wave[wave] = open_idx
+        batches[open_idx].deps |= dep_batches
+        place(step, open_idx)
+
+    return batches
+
+
+# --- Execution ---
+
+class _BlockhashCache:
+    """Shares one recent blockhash between all transactions, refreshing it when it gets old."""
+
+    def __init__(self, client: AsyncClient):
+        self.client = client
+        self._value = None
+        self._fetched_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def get(self):
+        async with self._lock:
+            if self._value is None or time.monotonic() - self._fetched_at > BLOCKHASH_MAX_AGE_SECONDS:
+                resp = await self.client.get_latest_blockhash()
+                self._value = resp.value
+                self._fetched_at = time.monotonic()
+            return self._value
+
+
+async def _send_batch(client: AsyncClient, payer: Keypair, batch: _Batch, blockhashes: _BlockhashCache) -> Signature:
+    latest = await blockhashes.get()
+    msg = MessageV0.try_compile(
+        payer=payer.pubkey(),
+        instructions=batch.instructions(),
+        address_lookup_table_accounts=[],
+        recent_blockhash=latest.blockhash,
+    )
+    tx = VersionedTransaction(msg, batch.signers(payer))
+    signature = await client.send_transaction(tx, opts=TxOpts(skip_preflight=False, preflight_commitment="confirmed"))
+    await client.confirm_transaction(
+        signature.value,
+        commitment="confirmed",
+        last_valid_block_height=latest.last_valid_block_height,
+    )
+    return signature.value
+
+
+async def provision(
+    client: AsyncClient, payer: Keypair, spec: ProvisioningSpec, max_parallel: int = MAX_PARALLEL_SENDS
+) -> list[Signature]:
+    """
+    Provisions everything in `spec`. Independent branches of the dependency graph are
+    submitted in parallel; a transaction is sent as soon as the ones it depends on are confirmed.
+    Raises the first error after all runnable transactions have finished.
+    """
+    mint_rent = await get_rent_exemption(client, MINT_ACCOUNT_SIZE) if spec.mints else 0
+    batches = plan_batches(payer, _build_steps(payer, spec, mint_rent))
+    print(f"Provisioning plan: {sum(len(b.steps) for b in batches)} steps in {len(batches)} transactions "
+          f"across {1 + max((b.wave for b in batches), default=-1)} waves.")
+
+    blockhashes = _BlockhashCache(client)
+    semaphore = asyncio.Semaphore(max_parallel)
+    tasks: list[asyncio.Task] = []
+
+    async def run(idx: int, batch: _Batch) -> Signature:
+        # Batches only depend on earlier batches, so their tasks already exist.
+        await asyncio.gather(*(tasks[d] for d in batch.deps))
+        async with semaphore:
+            signature = await _send_batch(client, payer, batch, blockhashes)
+        print(f"Transaction {idx + 1}/{len(batches)} confirmed ({len(batch.steps)} steps): {signature}")
+        return signature
+
+    for idx, batch in enumerate(batches):
+        tasks.append(asyncio.create_task(run(idx, batch)))
+
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    errors = [(batches[i], r) for i, r in enumerate(results) if isinstance(r, BaseException)]
+    for batch, error in errors:
+        print(f"Transaction failed ({'; '.join(s.description for s in batch.steps[:3])}...): {error}")
+    if errors:
+        raise errors[0][1]
+    return results